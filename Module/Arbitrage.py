@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from math import log
+
+INF = float('inf')
+
+def findCycles(graph, coin, maxlen=4, quantity=None, min_profit=0.0):
+    ''' Profitable trade loops of at most 'maxlen' trades that start
+        and end at 'coin', over the log rates of a RouteGraph, so fees and
+        overshoot are already taken off. If 'quantity' is given, every
+        trade must also pass the mintrade and volume checks at that size.
+
+        A depth first search over loop-free paths, in the manner of
+        RouteGraph.search: trades are tried best potential first, and a
+        branch is dropped once its potential (and, with 'quantity', its
+        ceiling) from RouteGraph.bounds can't clear 'min_profit'. Neither
+        underestimates a branch, so every profitable loop is found.
+        Keeping only the best label per coin (as Bellman-Ford or SPFA
+        would) can't do that: the checks depend on how much reaches each
+        trade, and a path must not revisit a coin, so a path that is
+        behind at some coin can still be the only one that closes a loop.
+
+        Returns [(profit, [(CURRENCY, QUANTITY), ...]), ...] sorted from
+        most to least profitable, where profit is the fractional gain. '''
+    bound, ceiling, order = graph.bounds(coin, maxlen)
+    start = log(quantity) if quantity else 0.0
+    target = start + log(1.0 + min_profit)
+    cycles = []
+    visited = set([coin])
+    def visit(sym, lq, path, left):
+        for rate, nsym, lw, lmin, lcap in order[left-1].get(sym, ()):
+            if lq + rate <= target: break
+            if quantity and (ceiling[left-1][nsym] <= target or not (lmin <= lq <= lcap)): continue
+            if nsym == coin:
+                cycles.append(path + (coin,))
+            elif left > 1 and nsym not in visited:
+                visited.add(nsym)
+                visit(nsym, lq + lw, path + (nsym,), left - 1)
+                visited.discard(nsym)
+    visit(coin, start, (coin,), maxlen)
+
+    found = []
+    for path in cycles:
+        route = graph.quantities(path, quantity or 1.0)
+        found.append((route[-1][1]/route[0][1] - 1.0, route))
+    found.sort(key=lambda c: c[0], reverse=True)
+    return found
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import asyncio
+from .CryptopiaWrapper import CryptopiaWrapper, orderGroups
+from .ConnectionPool import http_client
+
+class AsyncCryptopiaWrapper(CryptopiaWrapper):
+    ''' CryptopiaWrapper for asyncio (Python 3.5+). Every API method,
+        e.g. getMarkets() or submitTrade(), returns a coroutine instead
+        of blocking.
+
+        Signing, retries and rate limits are shared with the blocking
+        client through CryptopiaWrapper.steps. Rate limits are waited out
+        with asyncio.sleep, and each HTTP request runs on the event loop's
+        default executor over the shared transport, normally a keep-alive
+        connection pool, so several calls can be in flight at once.
+        Network errors are raised to the caller rather than exiting the
+        program. '''
+
+    async def query(self, method, req = {}, consume=None):
+        loop = asyncio.get_event_loop()
+        steps = self.steps(method, req, consume)
+        reply = None
+        while True:
+            action, arg = steps.send(reply)
+            reply = None
+            if action == 'sleep':
+                if arg > 0:
+                    await asyncio.sleep(arg)
+            elif action == 'request':
+                try:
+                    reply = await loop.run_in_executor(None, self.transport.request, *arg)
+                except (IOError, http_client.HTTPException) as e:
+                    reply = e
+            else:
+                return arg
+
+    async def getMarketOrderGroups(self, Ids, depth):
+        ''' CryptopiaWrapper.getMarketOrderGroups, with the requests for
+            every group of ids in flight at once. '''
+        groups = await asyncio.gather(*[self.query("GetMarketOrderGroups", [ group, depth ] )
+                                        for group in orderGroups(Ids)])
+        return [book for books in groups for book in books]
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import select, socket, threading, zlib
+from . import six
+
+http_client = six.moves.http_client
+
+class Decoder(object):
+    ''' Reads a gzip or deflate encoded response body as plain bytes. '''
+    def __init__(self, response, encoding):
+        self.response = response
+        self.encoding = encoding
+        self.zlib = None
+        self.done = False
+
+    def decompress(self, chunk):
+        if self.zlib is None:
+            if self.encoding == 'gzip':
+                self.zlib = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            elif bytearray(chunk[:1])[0] & 0x0f == 8:
+                self.zlib = zlib.decompressobj()
+            else:
+                # Some servers send 'deflate' without the zlib header
+                self.zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self.zlib.decompress(chunk)
+
+    def read(self, size=None):
+        if size is None or size < 0:
+            if self.done: return b''
+            self.done = True
+            data = self.response.read()
+            return (self.decompress(data) + self.zlib.flush()) if data else b''
+        while not self.done:
+            chunk = self.response.read(size)
+            if not chunk:
+                self.done = True
+                return self.zlib.flush() if self.zlib else b''
+            data = self.decompress(chunk)
+            if data: return data
+        return b''
+
+class ConnectionPool(object):
+    ''' Keep-alive HTTP(S) connections to one host, shared between threads.
+
+        Each request checks a connection out of the pool, so no two
+        threads ever talk over the same socket, and hands it back once the
+        whole response has been read. Up to 'maxsize' idle connections
+        are kept open; extra ones are closed. '''
+
+    def __init__(self, url, maxsize=4, timeout=30.0):
+        parts = six.moves.urllib.parse.urlsplit(url)
+        assert parts.scheme in ('http', 'https'), 'Unsupported URL <%s>'%url
+        self.scheme = parts.scheme
+        self.host = parts.netloc
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.scheme == 'https':
+            return http_client.HTTPSConnection(self.host, timeout=self.timeout)
+        return http_client.HTTPConnection(self.host, timeout=self.timeout)
+
+    def acquire(self):
+        ''' (connection, reused) '''
+        while True:
+            with self.lock:
+                if not self.idle: break
+                connection = self.idle.pop()
+            # An idle socket only becomes readable once the server closes it
+            sock = connection.sock
+            if sock is not None and not select.select([sock], [], [], 0)[0]:
+                return connection, True
+            connection.close()
+        return self.connect(), False
+
+    def release(self, connection):
+        with self.lock:
+            if len(self.idle) < self.maxsize:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, method, path, body=None, headers={}, retry=True, consume=None):
+        ''' Send one request and return (status, headers, body), with the
+            header names lower-cased. If 'consume' is given, a 200 body is
+            whatever consume(response) returns after reading the response
+            itself, e.g. while decoding it in chunks. gzip and deflate
+            encoded bodies are decompressed on the way, for 'consume' too.
+
+            The server may drop an idle connection just as it is reused,
+            which only shows up once a request is sent on it. If 'retry',
+            a failure on a reused connection is retried on a new one;
+            pass False for requests that must never be sent twice. Errors
+            on a new connection are raised. '''
+        while True:
+            connection, reused = self.acquire()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                encoding = (response.getheader('Content-Encoding') or '').lower()
+                body = Decoder(response, encoding) if encoding in ('gzip', 'deflate') else response
+                if consume is not None and response.status == 200:
+                    data = consume(body)
+                else:
+                    data = body.read()
+            except (http_client.HTTPException, socket.error):
+                connection.close()
+                if reused and retry: continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(connection)
+            return response.status, {k.lower(): v for k, v in response.getheaders()}, data
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
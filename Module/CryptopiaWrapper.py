@@ -3,10 +3,33 @@
 import base64, hashlib, hmac, json, os, sys, time
 from datetime import datetime
 from . import six
-
-public_set = set([ "GetCurrencies", "GetTradePairs", "GetMarkets", "GetMarket", "GetMarketHistory", "GetMarketOrders" ])
-private_set = set([ "GetBalance", "GetDepositAddress", "GetOpenOrders", "GetTradeHistory", "GetTransactions", "SubmitTrade", "CancelTrade", "SubmitTip", "SubmitWithdraw"])
+from .ConnectionPool import ConnectionPool, http_client
+from .RateLimiter import TokenBucket
+from .Nonce import NonceGenerator
+from .RetryPolicy import RetryPolicy
+from .MarketColumns import MarketColumns
+
+public_set = set([ "GetCurrencies", "GetTradePairs", "GetMarkets", "GetMarket", "GetMarketHistory", "GetMarketOrders", "GetMarketOrderGroups" ])
+# Whole-exchange snapshots worth revalidating instead of downloading again.
+# Only these are cached, so per-market calls can't grow the cache.
+conditional_set = set([ "GetCurrencies", "GetTradePairs", "GetMarkets" ])
+private_set = set([ "GetBalance", "GetDepositAddress", "GetOpenOrders", "GetTradeHistory", "GetTransactions", "SubmitTrade", "CancelTrade", "SubmitTip", "SubmitWithdraw", "SubmitTransfer"])
 NonceTimeFactor = 3
+API_URL = 'https://www.cryptopia.co.nz/api'
+# Longest '-'-joined id list sent in one GetMarketOrderGroups URL
+GROUP_URL_LIMIT = 1500
+
+def orderGroups(Ids):
+    ''' '-'-joined lists of 'Ids' for GetMarketOrderGroups URLs, each at
+        most GROUP_URL_LIMIT characters long unless it is a single id. '''
+    chunk = []
+    for Id in Ids:
+        if chunk and len('-'.join(map(str, chunk + [Id]))) > GROUP_URL_LIMIT:
+            yield '-'.join(map(str, chunk))
+            chunk = []
+        chunk.append(Id)
+    if chunk:
+        yield '-'.join(map(str, chunk))
 
 def NonceValue(NonceTimeFactor):
     Nonce = str( int( time.time() * NonceTimeFactor - 4361732500 ) )
@@ -14,69 +37,133 @@ def NonceValue(NonceTimeFactor):
 
 class CryptopiaWrapper:
 
-    def __init__(self, PublicKey, PrivateKey, retries=3):
+    def __init__(self, PublicKey, PrivateKey, retries=3, public_rate=5.0, public_burst=5,
+                 private_rate=5.0, private_burst=3, nonce_file=None, base_url=API_URL,
+                 transport=None):
         self._PublicKey = PublicKey
         self._PrivateKey = PrivateKey
-        self.http_retries = retries
-
-    def query(self, method, req = {}):
-        assert self._PublicKey  != 'YOUR_PUBLIC_KEY_HERE', 'Be sure to enter your public and private keys in the config/teleporter.ini file.'
-        assert self._PrivateKey != 'YOUR_PRIVATE_KEY_HERE', 'Be sure to enter your public and private keys in the config/teleporter.ini file.'
-        time.sleep(1.0 / float(NonceTimeFactor) + 0.01)
+        self.retry = RetryPolicy(retries)
+        self.limits = {'public':  TokenBucket(public_rate, public_burst),
+                       'private': TokenBucket(private_rate, private_burst)}
+        # Counter-based nonces, so private calls aren't tied to the clock
+        self.nonces = NonceGenerator(lambda: int(NonceValue(NonceTimeFactor)), nonce_file)
+        # Keep-alive connections, so only the first call pays the TLS handshake.
+        # Any object with the same request() can stand in (see Transport).
+        self.base_url = base_url.rstrip('/')
+        self.transport = transport or ConnectionPool(self.base_url)
+        self.path = six.moves.urllib.parse.urlsplit(self.base_url).path
+        # {(path, consume): (validator headers, data)} for conditional_set
+        # calls whose responses carried an ETag or Last-Modified
+        self.conditional = {}
+
+    def query(self, method, req = {}, consume=None):
+        steps = self.steps(method, req, consume)
+        reply = None
         try:
-            if method in public_set:
-                url = '/'.join(['https://www.cryptopia.co.nz/api', method] + list(req.keys()))
-                r = six.moves.urllib.request.urlopen(url).read()
-
-            elif method in private_set:
-                repeat = self.http_retries
-                while repeat > 0:
-                    r = None
-                    url = 'https://www.cryptopia.co.nz/api/' + method
-                    nonce = NonceValue(NonceTimeFactor)
-                    post_data = six.b(json.dumps(req))
-                    m = hashlib.md5()
-                    m.update(post_data)
-                    requestContentBase64String = base64.b64encode(m.digest())
-                    signature = six.b(self._PublicKey + "POST" + six.moves.urllib.parse.quote_plus( url ).lower() + nonce) + requestContentBase64String
-                    hmacsignature = base64.b64encode(hmac.new(base64.b64decode(self._PrivateKey), signature, hashlib.sha256).digest())
-                    header_value = "amx " + self._PublicKey + ":" + hmacsignature.decode('utf-8') +  ":" + nonce
-                    handler = six.moves.urllib.request.HTTPSHandler()
-                    opener  = six.moves.urllib.request.build_opener(handler)
-                    request = six.moves.urllib.request.Request(url, data=post_data)
-                    request.add_header('Authorization', header_value)
-                    request.add_header("Content-Type",'application/json; charset=utf-8')
-                    request.get_method = lambda: 'POST'
+            while True:
+                action, arg = steps.send(reply)
+                reply = None
+                if action == 'sleep':
+                    time.sleep(arg)
+                elif action == 'request':
                     try:
-                        connection = opener.open(request)
-                    except six.moves.urllib.error.HTTPError as e:
-                        connection = e
-
-                    # check. Substitute with appropriate HTTP code.
-                    if connection.code == 200:
-                        r = connection.read()
-                        break
-                    elif connection.code == 503:
-                        six.print_(r, "The server is currently unavailable. Retrying %d more times."%repeat)
-                        repeat -= 1
-                        time.sleep( 5 )
-                    elif connection.code == 429:
-                        six.print_(r, "Too many requests in a given amount of time.")
-                        break
-                    else:
-                        repeat -= 1
-                        six.print_('Connection error. Retrying %d more times.'%repeat)
-                        time.sleep( 5 )
-            else:
-                assert False, 'API Method <%s> not defined'%method
-        except IOError as e:
+                        reply = self.transport.request(*arg)
+                    except (IOError, http_client.HTTPException) as e:
+                        reply = e
+                else:
+                    return arg
+        except (IOError, http_client.HTTPException) as e:
             six.print_('\033[91m\n\nUnable to reach server.\033[0m Exception:')
             six.print_(e)
             sys.exit(1)
 
-        result = json.loads(r)
-        assert result['Success'], result['Error']
-        return result['Data']
+    def steps(self, method, req, consume=None):
+        ''' One API call as a generator that leaves sleeping and network I/O
+            to the caller, so blocking and asyncio clients share it. It
+            yields ('sleep', seconds) and ('request', transport.request
+            arguments), expects (status, headers, body) or the exception
+            raised back for each request, and finally yields ('result',
+            data). Failures are retried as self.retry allows.
+
+            With 'consume' (see ConnectionPool.request) the response body
+            is decoded by it, and its result is the data.
+
+            Public calls ask for a compressed response. Repeat calls in
+            conditional_set send the validators of the last one, so an
+            unchanged result comes back as an empty 304 and the earlier
+            data is reused. '''
+        assert self._PublicKey  != 'YOUR_PUBLIC_KEY_HERE', 'Be sure to enter your public and private keys in the config/teleporter.ini file.'
+        assert self._PrivateKey != 'YOUR_PRIVATE_KEY_HERE', 'Be sure to enter your public and private keys in the config/teleporter.ini file.'
+        assert method in public_set or method in private_set, 'API Method <%s> not defined'%method
+        attempt = 0
+        while True:
+            cached = None
+            if method in public_set:
+                yield ('sleep', self.limits['public'].reserve())
+                args = req if isinstance(req, list) else list(req.keys())
+                path = '/'.join([self.path, method] + [str(a) for a in args])
+                if method in conditional_set:
+                    cached = self.conditional.get((path, consume))
+                headers = dict(cached[0]) if cached else {}
+                headers['Accept-Encoding'] = 'gzip, deflate'
+                request = ('GET', path, None, headers, True, consume)
+            else:
+                yield ('sleep', self.limits['private'].reserve())
+                post_data, header_value = self.sign(method, req)
+                request = ('POST', self.path + '/' + method, post_data,
+                           {'Authorization': header_value, 'Content-Type': 'application/json; charset=utf-8'},
+                           self.retry.idempotent(method), consume)
+
+            reply = yield ('request', request)
+            if isinstance(reply, Exception):
+                status, headers, error = None, {}, reply
+            else:
+                status, headers, r = reply
+                if status == 304 and cached:
+                    yield ('result', cached[1])
+                    return
+                error = None if status == 200 else IOError('HTTP Error %d for %s'%(status, request[1]))
+            if error is None:
+                break
+            if not self.retry.retryable(method, attempt, status):
+                raise error
+            wait = self.retry.delay(attempt, headers.get('retry-after'))
+            six.print_('%s failed (%s). Retrying in %.2f s.'%(method, error, wait))
+            attempt += 1
+            yield ('sleep', wait)
+
+        if consume is not None:
+            data = r
+        else:
+            result = json.loads(r)
+            assert result['Success'], result['Error']
+            data = result['Data']
+        if method in conditional_set:
+            validators = {}
+            if 'etag' in headers:
+                validators['If-None-Match'] = headers['etag']
+            if 'last-modified' in headers:
+                validators['If-Modified-Since'] = headers['last-modified']
+            if validators:
+                self.conditional[(path, consume)] = (validators, data)
+        yield ('result', data)
+
+    def sign(self, method, req):
+        ''' (post_data, Authorization header) for a private call. '''
+        url = self.base_url + '/' + method
+        nonce = str(self.nonces.issue())
+        post_data = six.b(json.dumps(req))
+        m = hashlib.md5()
+        m.update(post_data)
+        requestContentBase64String = base64.b64encode(m.digest())
+        signature = six.b(self._PublicKey + "POST" + six.moves.urllib.parse.quote_plus( url ).lower() + nonce) + requestContentBase64String
+        hmacsignature = base64.b64encode(hmac.new(base64.b64decode(self._PrivateKey), signature, hashlib.sha256).digest())
+        header_value = "amx " + self._PublicKey + ":" + hmacsignature.decode('utf-8') +  ":" + nonce
+        return post_data, header_value
+
+    def rateLimitWait(self):
+        ''' Total seconds spent waiting on the rate limits so far. '''
+        return sum(bucket.waited for bucket in self.limits.values())
 
     ##### Public:
     def getCurrencies(self):
@@ -85,6 +172,10 @@ class CryptopiaWrapper:
     def getMarkets(self):
         return self.query("GetMarkets")
 
+    def getMarketColumns(self):
+        ''' GetMarkets as MarketColumns, decoded while it downloads. '''
+        return self.query("GetMarkets", consume=MarketColumns.read)
+
     def getMarket(self, Id):
         return self.query("GetMarket", [ Id ] )
 
@@ -94,6 +185,15 @@ class CryptopiaWrapper:
     def getMarketOrders(self, Id, depth):
         return self.query("GetMarketOrders", [ Id, depth ] )
 
+    def getMarketOrderGroups(self, Ids, depth):
+        ''' Order books for many TradePairIds, as a list of {'TradePairId',
+            'Market', 'Buy', 'Sell'}. The ids go in the URL, so they are
+            sent in as few requests as keep it under GROUP_URL_LIMIT. '''
+        books = []
+        for group in orderGroups(Ids):
+            books.extend(self.query("GetMarketOrderGroups", [ group, depth ] ))
+        return books
+
     ##### Private:
     def submitTrade(self, Id, Type, Rate, Amount):
         # Amount is in units of top currency (e.g. if I'm placing a 'buy' order on
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+from decimal import ROUND_UP, ROUND_DOWN, ROUND_HALF_EVEN
+from decimal import Decimal as Dec
+
+# Cryptopia amounts and rates have 8 decimal places, so everything here
+# is an integer count of 1e-8 units.
+UNIT = 10**8
+# TradeFee is a percentage, so a fee in units is 100% at this value.
+HUNDRED = 100*UNIT
+
+def toUnits(value, rounding=ROUND_DOWN):
+    ''' 'value' (float, Decimal or string) as a whole number of units. '''
+    return int((Dec(value) * UNIT).to_integral_value(rounding=rounding))
+
+def fromUnits(units):
+    ''' Exact Decimal for a number of units, for display and the API. '''
+    return Dec(units).scaleb(-8)
+
+def feeUnits(fee):
+    ''' A TradeFee percentage in units. The API sends short decimals like
+        0.3, so convert the float's shortest repr rather than its binary
+        value, which can sit just below and lose a unit. '''
+    return toUnits(repr(float(fee)), ROUND_HALF_EVEN)
+
+def toFloat(units):
+    return units / float(UNIT)
+
+def sellRate(bid, fee, overshoot):
+    ''' What sellOrder gets for one unit, before rounding the output. '''
+    rate = toUnits(bid * (1.0 - overshoot), ROUND_DOWN)
+    return toFloat(rate) * (HUNDRED - feeUnits(fee)) / HUNDRED
+
+def buyRate(ask, fee, overshoot):
+    ''' What buyOrder gets for one unit, before rounding the amount and
+        output. '''
+    rate = toUnits(ask * (1.0 + overshoot), ROUND_UP)
+    if rate <= 0: return 0.0
+    feeunits = feeUnits(fee)
+    return float(UNIT) / rate * (HUNDRED - feeunits) / (HUNDRED + feeunits)
+
+def sellOrder(units, bid, fee, overshoot):
+    ''' (rate, amount, output) for selling 'units' of the trade currency
+        at 'overshoot' below 'bid'. The rate is rounded down and the fee
+        comes out of the base currency received. '''
+    rate = toUnits(bid * (1.0 - overshoot), ROUND_DOWN)
+    output = units * rate * (HUNDRED - feeUnits(fee)) // (UNIT * HUNDRED)
+    return (rate, units, output)
+
+def buyOrder(units, ask, fee, overshoot):
+    ''' (rate, amount, output) for spending 'units' of the base currency
+        at 'overshoot' above 'ask'. The rate is rounded up, and the amount
+        leaves room for the fee on top of amount*rate, which the exchange
+        also takes out of the trade currency received. '''
+    rate = toUnits(ask * (1.0 + overshoot), ROUND_UP)
+    if rate <= 0: return (rate, 0, 0)
+    feeunits = feeUnits(fee)
+    amount = units * UNIT * HUNDRED // (rate * (HUNDRED + feeunits))
+    output = amount * (HUNDRED - feeunits) // HUNDRED
+    return (rate, amount, output)
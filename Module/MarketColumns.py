@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import json, re
+from array import array
+from collections import namedtuple
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+FIELDS = ('BidPrice', 'AskPrice', 'Volume', 'BaseVolume')
+MarketRow = namedtuple('MarketRow', ('TradePairId',) + FIELDS)
+
+NUMBER = br'\s*:\s*(null|[-+0-9.eE]+)'
+# One pattern per kept field, each capturing its number
+VALUE = {f: re.compile(b'"' + f.encode('ascii') + b'"' + NUMBER) for f in ('TradePairId',) + FIELDS}
+# An object opening, or any kept field with its number
+TOKEN = re.compile(br'(\{)|"(TradePairId|BidPrice|AskPrice|Volume|BaseVolume)"' + NUMBER)
+SUCCESS = re.compile(br'"Success"\s*:\s*true')
+CHUNK = 1 << 16
+
+class MarketColumns(Mapping):
+    ''' A GetMarkets response as parallel arrays, decoded as it streams in
+        without building a dict per market. Reads like the usual
+        {TradePairId: market} dict, producing a MarketRow on lookup. '''
+
+    def __init__(self):
+        self.TradePairId = array('l')
+        self.columns = {f: array('d') for f in FIELDS}
+        self.index = {}
+        self.buffer = b''
+        self.envelope = None
+
+    @staticmethod
+    def read(response):
+        ''' Decode an HTTP response body, CHUNK bytes at a time. '''
+        columns = MarketColumns()
+        while True:
+            chunk = response.read(CHUNK)
+            if not chunk: break
+            columns.feed(chunk)
+        return columns.finish()
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if self.envelope is None:
+            start = self.buffer.find(b'"Data"')
+            if start < 0: return
+            self.envelope = self.buffer[:start]
+        if not SUCCESS.search(self.envelope):
+            return  # Kept whole for finish() to check
+        end = self.buffer.rfind(b'}') + 1
+        self.decode(self.buffer[:end])
+        self.buffer = self.buffer[end:]
+
+    def decode(self, data):
+        ''' Append the markets in 'data', which ends with a whole object. '''
+        values = [VALUE[f].findall(data) for f in ('TradePairId',) + FIELDS]
+        if all(len(v) == len(values[0]) and b'null' not in v for v in values):
+            # Every market has every field, so the columns line up
+            ids = [int(Id) for Id in values[0]]
+            start = len(self.TradePairId)
+            self.index.update(zip(ids, range(start, start + len(ids))))
+            self.TradePairId.extend(ids)
+            for f, v in zip(FIELDS, values[1:]):
+                self.columns[f].extend(map(float, v))
+            return
+        # Otherwise walk the fields object by object
+        row = {}
+        for match in TOKEN.finditer(data):
+            if match.group(1):
+                self.append(row)
+                row = {}
+            else:
+                value = match.group(3)
+                row[match.group(2)] = 0.0 if value == b'null' else float(value)
+        self.append(row)
+
+    def append(self, row):
+        # Keys are the field names as matched, i.e. bytes
+        if b'TradePairId' not in row: return
+        Id = int(row[b'TradePairId'])
+        self.index[Id] = len(self.TradePairId)
+        self.TradePairId.append(Id)
+        for f in FIELDS:
+            self.columns[f].append(row.get(f.encode('ascii'), 0.0))
+
+    def finish(self):
+        ''' Check the response succeeded and flush the last market. '''
+        if self.envelope is None or not SUCCESS.search(self.envelope):
+            result = json.loads(self.buffer.decode('utf-8'))
+            assert result['Success'], result['Error']
+            self.decode(self.buffer)
+        self.buffer = b''
+        return self
+
+    def __getitem__(self, Id):
+        i = self.index[Id]
+        return MarketRow(Id, *[self.columns[f][i] for f in FIELDS])
+
+    def __iter__(self):
+        return iter(self.TradePairId)
+
+    def __len__(self):
+        return len(self.TradePairId)
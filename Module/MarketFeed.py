@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import time
+from collections import namedtuple
+from .Markets import MARKET_FIELDS, Market, diffMarkets
+from .RateLimiter import clock
+
+# kind is 'opened' when a market becomes tradeable (it appears, or its pair
+# goes to Status OK), 'closed' when it stops being tradeable and 'changed'
+# when any of 'fields' moved on a tradeable market. old/new are the market
+# before and after, None where there is none.
+MarketDelta = namedtuple('MarketDelta', ['TradePairId', 'kind', 'fields', 'old', 'new'])
+
+class MarketFeed(object):
+    ''' Polls GetMarkets every 'interval' seconds and yields only what
+        changed, as lists of MarketDelta.
+
+        Trade pair statuses are re-read every 'pairs_interval' seconds
+        (never if 0). All calls go through the wrapper, so they share its
+        connection and rate limits. The latest data stay in 'markets' and
+        'status', e.g. for Network.refresh(markets=feed.markets). '''
+
+    def __init__(self, api, interval=10.0, pairs_interval=300.0):
+        self.api = api
+        self.interval = interval
+        self.pairs_interval = pairs_interval
+        self.markets = {}
+        self.status = {}
+        self.pairs_time = None
+
+    def fetch(self):
+        if hasattr(self.api, 'getMarketColumns'):
+            return self.api.getMarketColumns()
+        return {q['TradePairId']:Market(q) for q in self.api.query('GetMarkets')}
+
+    def tradeable(self, Id, markets):
+        return Id in markets and self.status.get(Id) == 'OK'
+
+    def poll(self):
+        ''' Fetch once and return the deltas since the previous poll. The
+            first poll opens every tradeable market. '''
+        oldstatus = self.status
+        if self.pairs_time is None or (self.pairs_interval and clock() - self.pairs_time >= self.pairs_interval):
+            self.status = {q['Id']:q['Status'] for q in self.api.query('GetTradePairs')}
+            self.pairs_time = clock()
+        old, new = self.markets, self.fetch()
+        self.markets = new
+
+        changed = diffMarkets(old, new)
+        changed.update(Id for Id in set(oldstatus) | set(self.status) if oldstatus.get(Id) != self.status.get(Id))
+        deltas = []
+        for Id in sorted(changed):
+            before, after = old.get(Id), new.get(Id)
+            was = Id in old and oldstatus.get(Id) == 'OK'
+            now = self.tradeable(Id, new)
+            if now and not was:
+                deltas.append(MarketDelta(Id, 'opened', MARKET_FIELDS, before, after))
+            elif was and not now:
+                deltas.append(MarketDelta(Id, 'closed', MARKET_FIELDS, before, after))
+            elif now:
+                fields = tuple(f for f in MARKET_FIELDS if getattr(before, f) != getattr(after, f))
+                if fields:
+                    deltas.append(MarketDelta(Id, 'changed', fields, before, after))
+        return deltas
+
+    def __iter__(self):
+        ''' Poll forever on a fixed schedule, yielding non-empty delta lists. '''
+        due = clock()
+        while True:
+            wait = due - clock()
+            if wait > 0:
+                time.sleep(wait)
+            due = max(due + self.interval, clock())
+            deltas = self.poll()
+            if deltas:
+                yield deltas
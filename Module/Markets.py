@@ -19,9 +19,73 @@
     along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
+import threading, time
+from collections import namedtuple
 from . import six
+from . import Snapshot
+from . import FixedPoint
+from .Routing import RouteCache, RouteGraph
+from .Arbitrage import findCycles
+from .OrderBooks import OrderBookCache
+from .RateMatrix import RateMatrix
+from .MarketColumns import MarketColumns
+
+# Fields that feed the route graph, compared by Network.refresh
+MARKET_FIELDS = ('BidPrice', 'AskPrice', 'Volume', 'BaseVolume')
+PAIR_FIELDS = ('Status', 'TradeFee', 'MinimumBaseTrade')
+
+# API fields kept on each record (and in snapshots)
+CURRENCY_FIELDS = ('Id', 'Name', 'Symbol', 'MinBaseTrade', 'IsTipEnabled', 'MinTip', 'Status')
+TRADEPAIR_FIELDS = ('BaseCurrency', 'BaseSymbol', 'Currency', 'Id', 'Label', 'MaximumBaseTrade',
+                    'MaximumPrice', 'MaximumTrade', 'MinimumBaseTrade', 'MinimumPrice',
+                    'MinimumTrade', 'Status', 'StatusMessage', 'Symbol', 'TradeFee')
+
+def fetchAll(calls):
+    ''' {name: call()} for every {name: call}, with the calls made
+        concurrently on one thread each. The first error raised by any
+        call is raised again here once they have all finished. '''
+    results, errors = {}, []
+    def fetch(name):
+        try:
+            results[name] = calls[name]()
+        except BaseException as e:
+            errors.append(e)
+    threads = [threading.Thread(target=fetch, args=(name,)) for name in calls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+def diffMarkets(old, new):
+    ''' TradePairIds that appeared, disappeared or moved between two
+        {TradePairId: Market} snapshots. '''
+    changed = set(old) ^ set(new)
+    for Id in set(old) & set(new):
+        if any(getattr(old[Id], f) != getattr(new[Id], f) for f in MARKET_FIELDS):
+            changed.add(Id)
+    return changed
+
+# rate = 1 of me can buy n of neighbor
+# volume = N of me have been traded for this neighbor in the past 24 hours
+Edge = namedtuple('Edge', ['neighbor', 'rate', 'fee', 'mintrade', 'volume'])
+
+class Market(object):
+    ''' The GetMarkets fields the router reads. '''
+    __slots__ = ('TradePairId',) + MARKET_FIELDS
+
+    def __init__(self, apidata):
+        self.TradePairId = apidata['TradePairId']
+        self.BidPrice = apidata['BidPrice']
+        self.AskPrice = apidata['AskPrice']
+        self.Volume = apidata['Volume']
+        self.BaseVolume = apidata['BaseVolume']
+
+class TradePair(object):
+    __slots__ = TRADEPAIR_FIELDS
 
-class TradePair:
     def __init__(self, api_entry):
         self.BaseCurrency = api_entry['BaseCurrency']
         self.BaseSymbol = api_entry['BaseSymbol']
@@ -39,7 +103,9 @@ class TradePair:
         self.Symbol = api_entry['Symbol']
         self.TradeFee = api_entry['TradeFee']
 
-class Commodity:
+class Commodity(object):
+    __slots__ = CURRENCY_FIELDS + ('neighbors', 'neighborindex')
+
     def __init__(self, apidata):
         self.Id = apidata['Id']
         self.Name = apidata['Name']
@@ -49,20 +115,34 @@ class Commodity:
         self.MinTip = apidata['MinTip']
         self.Status = apidata['Status']
         self.neighbors = []
+        self.neighborindex = {}
 
     def addneighbor(self, neighbor, rate, fee, mintrade, volume):
-        # rate = 1 of me can buy n of neighbor
-        # volume = N of me have been traded for this neighbor in the past 24 hours
-        self.neighbors.append((neighbor, rate, fee, mintrade, volume))
+        edge = Edge(neighbor, rate, fee, mintrade, volume)
+        self.neighbors.append(edge)
+        if neighbor.Symbol not in self.neighborindex:
+            self.neighborindex[neighbor.Symbol] = edge
+
+    def setneighbor(self, neighbor, rate, fee, mintrade, volume):
+        ''' Replace the edge to 'neighbor' in place, or add it. '''
+        edge = Edge(neighbor, rate, fee, mintrade, volume)
+        for i, n in enumerate(self.neighbors):
+            if n[0] is neighbor:
+                self.neighbors[i] = edge
+                self.neighborindex[neighbor.Symbol] = edge
+                return
+        self.addneighbor(neighbor, rate, fee, mintrade, volume)
+
+    def removeneighbor(self, symbol):
+        self.neighbors = [n for n in self.neighbors if n[0].Symbol != symbol]
+        self.neighborindex.pop(symbol, None)
 
     def getNeighbor(self, symbol):
-        for n in self.neighbors:
-            if n[0].Symbol == symbol:
-                return n
-        return None
+        return self.neighborindex.get(symbol)
 
     def clearneighbors(self):
         self.neighbors = []
+        self.neighborindex = {}
 
     def getRoute(self, quantity, goal, route=[], maxdepth=3, overshoot=0.0, vol_threshold=20):
         ''' Recursively query neighbors until 'goal' coin is reached. '''
@@ -89,67 +169,380 @@ class Commodity:
             
 
 class Network:
-    def __init__(self, api):
+    def __init__(self, api, backend='python', cache_ttl=60.0, cache_size=256,
+                 snapshot=None, snapshot_ttl=86400.0, market_ttl=0.0):
+        ''' If 'snapshot' names a file, currencies and trade pairs younger
+            than 'snapshot_ttl' seconds are loaded from it instead of the
+            API (and market data younger than 'market_ttl'), and it is
+            rewritten after every initialize().
+
+            backend='numpy' plans getBestRoutes with RateMatrix, which is
+            faster but heuristic and can miss the best route; the default
+            'python' backend gives the same routes as Commodity.getRoute. '''
+        assert backend in ('python', 'numpy'), 'Unknown route backend <%s>'%backend
         self.api = api
+        self.backend = backend
+        self.snapshot = snapshot
+        self.snapshot_ttl = snapshot_ttl
+        self.market_ttl = market_ttl
+        self.routecache = RouteCache(cache_size, cache_ttl)
         self.currencies = None
         self.markets = None
         self.pairs = None
+        self.pairindex = {}
+        self.graphs = {}
+        self.matrix = None
+        self.books = OrderBookCache(api)
         self.initialize()
 
     def initialize(self):
-        self.initcurrencies()
-        self.initpairs()
-        self.initmarkets()
+        cached = Snapshot.load(self.snapshot) if self.snapshot else None
+        static = Snapshot.fresh(cached, 'currencies', self.snapshot_ttl) and Snapshot.fresh(cached, 'pairs', self.snapshot_ttl)
+        markets = Snapshot.fresh(cached, 'markets', self.market_ttl)
+
+        # The three public calls don't depend on each other, so fetch
+        # whichever are needed at once and assemble the graph afterwards.
+        wanted = {}
+        if not static:
+            if self.currencies is None:
+                wanted['GetCurrencies'] = lambda: self.api.query('GetCurrencies')
+            wanted['GetTradePairs'] = lambda: self.api.query('GetTradePairs')
+        if not markets:
+            wanted['GetMarkets'] = self.fetchmarkets
+        fetched = fetchAll(wanted)
+
+        if static:
+            statictime = cached['pairs']['time']
+            self.initcurrencies(cached['currencies']['data'])
+            self.initpairs(cached['pairs']['data'])
+        else:
+            statictime = time.time()
+            self.initcurrencies(fetched.get('GetCurrencies'))
+            self.initpairs(fetched['GetTradePairs'])
+        if markets:
+            markettime = cached['markets']['time']
+            marketdata = self.loadmarkets(cached['markets']['data'])
+        else:
+            markettime = time.time()
+            marketdata = self.loadmarkets(fetched['GetMarkets'])
+        if any(Id not in self.pairs for Id in marketdata):
+            # Listed since the snapshot was taken
+            statictime = time.time()
+            self.relist()
+        self.initmarkets(marketdata)
+
+        if self.snapshot:
+            Snapshot.save(self.snapshot,
+                currencies=(statictime, [Snapshot.record(c, CURRENCY_FIELDS) for c in six.itervalues(self.currencies)]),
+                pairs=(statictime, [Snapshot.record(p, TRADEPAIR_FIELDS) for p in six.itervalues(self.pairs)]),
+                markets=(markettime, [Snapshot.record(m, Market.__slots__) for m in six.itervalues(self.markets)]))
 
-    def initcurrencies(self):
+    def initcurrencies(self, apidata=None):
         if self.currencies is None:
-            self.currencies = {q['Symbol']:Commodity(q) for q in self.api.query('GetCurrencies')}
+            if apidata is None:
+                apidata = self.api.query('GetCurrencies')
+            self.currencies = {q['Symbol']:Commodity(q) for q in apidata}
         else:
             for sym in self.currencies:
                 self.currencies[sym].clearneighbors()
 
-    def initpairs(self):
+    def initpairs(self, apidata=None):
         self.pairs = {}
-        apipairs = {q['Id']:q for q in self.api.query('GetTradePairs')}
+        self.pairindex = {}
+        if apidata is None:
+            apidata = self.api.query('GetTradePairs')
+        apipairs = {q['Id']:q for q in apidata}
         for p in apipairs:
             PAIR = TradePair(apipairs[p])
             self.pairs[apipairs[p]['Id']] = PAIR
+            self.pairindex.setdefault(PAIR.Label, []).append(PAIR)
 
-    def initmarkets(self):
+    def relist(self, apidata=None):
+        ''' Load the trade pairs again (from 'apidata' or the API), and
+            fetch the currencies too if a pair trades one this Network
+            doesn't know. Returns True if the currencies were replaced,
+            which drops their edges. '''
+        self.initpairs(apidata)
+        if all(p.Symbol in self.currencies and p.BaseSymbol in self.currencies for p in six.itervalues(self.pairs)):
+            return False
+        self.currencies = None
         self.initcurrencies()
-        self.markets = {q['TradePairId']:q for q in self.api.query('GetMarkets')}
+        return True
+
+    def fetchmarkets(self):
+        ''' GetMarkets data, streamed straight into MarketColumns when the
+            API supports it. '''
+        if hasattr(self.api, 'getMarketColumns'):
+            return self.api.getMarketColumns()
+        return self.api.query('GetMarkets')
+
+    def loadmarkets(self, apidata):
+        ''' {TradePairId: market} for fetchmarkets() or snapshot data. '''
+        if isinstance(apidata, (MarketColumns, dict)):
+            return apidata
+        return {q['TradePairId']:Market(q) for q in apidata}
+
+    def initmarkets(self, apidata=None):
+        self.initcurrencies()
+        if apidata is None:
+            apidata = self.fetchmarkets()
+        self.markets = self.loadmarkets(apidata)
+        self.graphs = {}
+        self.matrix = None
+        self.books.clear()
+        self.routecache.clear()
 
         for m in self.markets:
             MKT = self.markets[m]
-            pair = self.pairs[MKT['TradePairId']]
-            if pair.Status == 'OK':
-                sym = self.currencies[pair.Symbol]
-                base = self.currencies[pair.BaseSymbol]
-                bid = MKT['BidPrice']
-                ask = MKT['AskPrice']
-                vol = MKT['Volume']
-                basevol = MKT['BaseVolume']
-                if ask > 0 and bid > 0:
-                    sym.addneighbor(base, bid, pair.TradeFee, pair.MinimumBaseTrade/bid, vol)
-                    base.addneighbor(sym, 1.0/ask, pair.TradeFee, pair.MinimumBaseTrade, basevol)
+            pair = self.pairs.get(MKT.TradePairId)
+            if pair is None: continue
+            for sym, base, edge in self.marketedges(pair, MKT):
+                sym.addneighbor(base, *edge)
+
+    def marketedges(self, pair, MKT):
+        ''' (from, to, (rate, fee, mintrade, volume)) for both directions
+            of a tradeable market. '''
+        if pair.Status != 'OK': return []
+        sym = self.currencies[pair.Symbol]
+        base = self.currencies[pair.BaseSymbol]
+        bid = MKT.BidPrice
+        ask = MKT.AskPrice
+        vol = MKT.Volume
+        basevol = MKT.BaseVolume
+        if not (ask > 0 and bid > 0): return []
+        return [(sym, base, (bid, pair.TradeFee, pair.MinimumBaseTrade/bid, vol)),
+                (base, sym, (1.0/ask, pair.TradeFee, pair.MinimumBaseTrade, basevol))]
+
+    def refresh(self, pairs=False, markets=None):
+        ''' Re-fetch GetMarkets (and GetTradePairs if 'pairs') and update
+            only the edges of markets that changed since the last snapshot.
+            'markets' is a {TradePairId: market} already fetched elsewhere,
+            e.g. by a MarketFeed, to use instead of fetching again. Trade
+            pairs are also re-fetched when a market shows up that none of
+            them trade, and the graph is rebuilt if it lists a new coin.
+            Returns the set of (from_symbol, to_symbol) edges that changed. '''
+        oldpairs = self.pairs
+        wanted = {}
+        if pairs:
+            wanted['GetTradePairs'] = lambda: self.api.query('GetTradePairs')
+        if markets is None:
+            wanted['GetMarkets'] = self.fetchmarkets
+        fetched = fetchAll(wanted)
+        if markets is None:
+            markets = self.loadmarkets(fetched['GetMarkets'])
+        if pairs or any(Id not in self.pairs for Id in markets):
+            oldcurrencies = self.currencies
+            if self.relist(fetched.get('GetTradePairs')):
+                edges = set((sym, n.neighbor.Symbol) for sym in oldcurrencies for n in oldcurrencies[sym].neighbors)
+                self.initmarkets(markets)
+                edges.update((sym, n.neighbor.Symbol) for sym in self.currencies for n in self.currencies[sym].neighbors)
+                return edges
+        changed = diffMarkets(self.markets, markets)
+        for Id in set(oldpairs) | set(self.pairs):
+            old, new = oldpairs.get(Id), self.pairs.get(Id)
+            if old is None or new is None or any(getattr(old, f) != getattr(new, f) for f in PAIR_FIELDS):
+                changed.add(Id)
+        self.markets = markets
+
+        edges = set()
+        for Id in changed:
+            pair = self.pairs.get(Id, oldpairs.get(Id))
+            if pair is None: continue
+            if pair.Symbol not in self.currencies or pair.BaseSymbol not in self.currencies: continue
+            sym = self.currencies[pair.Symbol]
+            base = self.currencies[pair.BaseSymbol]
+            before = {(sym, base): sym.getNeighbor(base.Symbol), (base, sym): base.getNeighbor(sym.Symbol)}
+            after = {}
+            if Id in self.pairs and Id in markets:
+                after = {(a, b): edge for a, b, edge in self.marketedges(pair, markets[Id])}
+            for a, b in before:
+                if (a, b) in after:
+                    a.setneighbor(b, *after[(a, b)])
+                else:
+                    a.removeneighbor(b.Symbol)
+                if a.getNeighbor(b.Symbol) != before[(a, b)]:
+                    edges.add((a.Symbol, b.Symbol))
+            self.books.discard(Id)
+
+        if edges:
+            self.graphs = {}
+            self.matrix = None
+            self.routecache.invalidate(edges)
+        return edges
+
+    def routeChanged(self, route, edges):
+        ''' True if any trade on 'route' uses one of the changed 'edges'
+            reported by refresh. '''
+        coins = [coin for coin, qty in route]
+        return any(hop in edges for hop in zip(coins[:-1], coins[1:]))
 
     def getCurrency(self, symbol):
         return self.currencies[symbol]
 
     def getTradePair(self, coin1, coin2):
-        pair = [pair for pair in six.itervalues(self.pairs) \
-                if pair.Label == '%s/%s'%(coin1, coin2) or pair.Label == '%s/%s'%(coin2, coin1)]
+        pair = self.pairindex.get('%s/%s'%(coin1, coin2), [])
+        if coin1 != coin2:
+            pair = pair + self.pairindex.get('%s/%s'%(coin2, coin1), [])
         assert len(pair) == 1, 'Multiple markets found for trade pair %s / %s'%(coin1, coin2)
         return pair[0]
 
     def getMarket(self, Id):
         return self.markets[Id]
 
-    def getBestRoute(self, from_currency, to_currency, amount, maxTx, overshoot, vol_threshold):
+    def sizeTrade(self, from_currency, to_currency, units, overshoot):
+        ''' (pair, 'Buy'/'Sell', rate, amount, output) for trading 'units'
+            of 'from_currency' at the top-of-book rate, with every quantity
+            in FixedPoint units rounded the way the order is submitted. '''
+        pair = self.getTradePair(from_currency, to_currency)
+        market = self.markets[pair.Id]
+        if from_currency == pair.Symbol:
+            return (pair, 'Sell') + FixedPoint.sellOrder(units, market.BidPrice, pair.TradeFee, overshoot)
+        return (pair, 'Buy') + FixedPoint.buyOrder(units, market.AskPrice, pair.TradeFee, overshoot)
+
+    def replay(self, route, overshoot):
+        ''' 'route' with its quantities recomputed by sizeTrade, so they
+            match the amounts teleporter.py will actually submit. '''
+        units = FixedPoint.toUnits(route[0][1])
+        exact = [(route[0][0], FixedPoint.toFloat(units))]
+        for (sym, qty), (nsym, nqty) in zip(route[:-1], route[1:]):
+            units = self.sizeTrade(sym, nsym, units, overshoot)[4]
+            exact.append((nsym, FixedPoint.toFloat(units)))
+        return exact
+
+    def exactroute(self, result, overshoot):
+        value, route = result
+        if not route: return result
+        route = self.replay(route, overshoot)
+        return (route[-1][1], route)
+
+    def getGraph(self, overshoot, vol_threshold):
+        ''' Log-space route graph, built once per market snapshot. '''
+        key = (overshoot, vol_threshold)
+        if key not in self.graphs:
+            self.graphs[key] = RouteGraph(self.currencies, overshoot, vol_threshold, self.pricing(overshoot))
+        return self.graphs[key]
+
+    def pricing(self, overshoot):
+        ''' pricing(from, to) for RouteGraph: what one unit buys with the
+            same rounding and fee arithmetic as sizeTrade, so routes are
+            ranked by what their orders will really return. '''
+        def pricing(from_currency, to_currency):
+            pair = self.getTradePair(from_currency, to_currency)
+            market = self.markets[pair.Id]
+            if from_currency == pair.Symbol:
+                return FixedPoint.sellRate(market.BidPrice, pair.TradeFee, overshoot)
+            return FixedPoint.buyRate(market.AskPrice, pair.TradeFee, overshoot)
+        return pricing
+
+    def getMatrix(self):
+        ''' NumPy rate matrix, built once per market snapshot. '''
+        if self.matrix is None:
+            self.matrix = RateMatrix(self.currencies)
+        return self.matrix
+
+    def depthFill(self, graph, overshoot):
+        ''' fill(from, to, quantity) for RouteGraph.bestRoute that walks the
+            order book of each market, stopping at the same overshoot limit
+            price teleporter.py will submit. The overshoot and fee are taken
+            off as in Commodity.getRoute.
+
+            The book is fetched after the GetMarkets snapshot, so its best
+            level can beat the snapshot's rate. bestRoute's pruning relies
+            on fills never doing better than the graph's rate, so they are
+            capped at it. '''
+        def fill(from_currency, to_currency, quantity):
+            pair = self.getTradePair(from_currency, to_currency)
+            market = self.markets[pair.Id]
+            book = self.books.get(pair.Id)
+            if from_currency == pair.Symbol:
+                out = book.sell(quantity, market.BidPrice * (1.0 - overshoot))
+            else:
+                out = book.buy(quantity, market.AskPrice * (1.0 + overshoot))
+            if not out: return out
+            return min(out * (1.0 - overshoot) * (1.0 - pair.TradeFee/100.0),
+                       quantity * graph.rates[(from_currency, to_currency)])
+        return fill
+
+    def prefetchBooks(self, graph, from_currency, to_currency, amount, maxTx, k=8, avoid=()):
+        ''' Load the order books of every market on the 'k' best top-of-book
+            routes in bulk, so depthFill rarely has to fetch one at a time. '''
+        routes = graph.bestRoutes({from_currency: amount}, to_currency, maxdepth=maxTx, k=k, avoid=avoid)[from_currency]
+        self.books.prefetch(set(self.getTradePair(a, b).Id for value, route in routes
+                                for (a, qa), (b, qb) in zip(route[:-1], route[1:])))
+
+    def splitRoute(self, from_currency, to_currency, amount, maxTx, overshoot, vol_threshold, maxRoutes=4):
+        ''' Trades 'amount' of 'from_currency' for 'to_currency' over as many
+            as 'maxRoutes' routes, so that no market is asked to take more
+            than its volume threshold. Returns [(value, route), ...]; see
+            RouteGraph.splitRoutes. '''
+        key = ('splitRoute', from_currency, to_currency, amount, maxTx, overshoot, vol_threshold, maxRoutes)
+        cached = self.routecache.get(key)
+        if cached is not None:
+            return cached
+        graph = self.getGraph(overshoot, vol_threshold)
+        slices = graph.splitRoutes(from_currency, to_currency, amount, maxdepth=maxTx, maxroutes=maxRoutes)
+        slices = [self.exactroute(s, overshoot) for s in slices]
+        self.routecache.put(key, slices)
+        return slices
+
+    def findArbitrage(self, currency, overshoot, vol_threshold, maxTx=4, amount=None, min_profit=0.0):
+        ''' Loops that turn 'currency' into more of itself after fees and
+            overshoot, most profitable first. See Arbitrage.findCycles. '''
+        graph = self.getGraph(overshoot, vol_threshold)
+        return findCycles(graph, currency, maxlen=maxTx, quantity=amount, min_profit=min_profit)
+
+    def getBestRoute(self, from_currency, to_currency, amount, maxTx, overshoot, vol_threshold, depth=False, avoid=()):
         ''' Trades 'amount' of 'from_currency' for 'to_currency' with
-            no more than 'maxTx' transactions. '''
-        start = self.currencies[from_currency]
-        value, route = start.getRoute(amount, to_currency, maxdepth=maxTx, overshoot=overshoot, vol_threshold=vol_threshold)
+            no more than 'maxTx' transactions. With 'depth', each trade is
+            valued by walking the market's order book instead of assuming
+            the top-of-book rate fills any size. No trade is made along
+            the (from, to) pairs in 'avoid'. '''
+        avoid = frozenset(avoid)
+        key = ('getBestRoute', from_currency, to_currency, amount, maxTx, overshoot, vol_threshold, depth, avoid)
+        cached = self.routecache.get(key)
+        if cached is not None:
+            return cached
+        graph = self.getGraph(overshoot, vol_threshold)
+        fill = None
+        if depth:
+            self.prefetchBooks(graph, from_currency, to_currency, amount, maxTx, avoid=avoid)
+            fill = self.depthFill(graph, overshoot)
+        value, route = graph.bestRoute(from_currency, to_currency, amount, maxdepth=maxTx, fill=fill, avoid=avoid)
+        if not depth:
+            value, route = self.exactroute((value, route), overshoot)
         # route is a list of (CURRENCY, QUANTITY) pairs
+        self.routecache.put(key, (value, route))
         return (value, route)
 
+    def getBestRoutes(self, amounts_by_coin, to_currency, maxTx, overshoot, vol_threshold, k=None, avoid=()):
+        ''' Like getBestRoute, for every {currency: amount} in 'amounts_by_coin'
+            at once. Returns {currency: (value, route)}, or with 'k' a list
+            of up to k (value, route) alternatives per currency, best first. '''
+        avoid = frozenset(avoid)
+        key = lambda coin: ('getBestRoutes', coin, to_currency, amounts_by_coin[coin], maxTx, overshoot, vol_threshold, k, avoid)
+        results = {}
+        for coin in amounts_by_coin:
+            cached = self.routecache.get(key(coin))
+            if cached is not None:
+                results[coin] = cached
+        missing = {coin: amt for coin, amt in six.iteritems(amounts_by_coin) if coin not in results}
+        if missing:
+            if self.backend == 'numpy' and not k and not avoid:
+                found = self.getMatrix().bestRoutes(missing, to_currency, maxTx, overshoot, vol_threshold)
+                # Coins whose best walk loops get the exact search instead
+                looped = {coin: amt for coin, amt in six.iteritems(missing) if coin not in found}
+                if looped:
+                    found.update(self.getGraph(overshoot, vol_threshold).bestRoutes(looped, to_currency, maxdepth=maxTx))
+            else:
+                found = self.getGraph(overshoot, vol_threshold).bestRoutes(missing, to_currency, maxdepth=maxTx, k=k, avoid=avoid)
+            for coin in found:
+                if k:
+                    # Whole-unit rounding can still swap near-equal routes
+                    found[coin] = sorted((self.exactroute(r, overshoot) for r in found[coin]),
+                                         key=lambda r: r[0], reverse=True)
+                else:
+                    found[coin] = self.exactroute(found[coin], overshoot)
+                self.routecache.put(key(coin), found[coin])
+            results.update(found)
+        return results
+
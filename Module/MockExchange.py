@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+# A stand-in for the Cryptopia API, for running teleporter and benchmarks
+# offline:
+#
+#     python -m Module.MockExchange --port 8800 --coins 200
+#
+# then point Api_Url in config/teleporter.ini at the printed URL and use
+# the printed keys. Markets are synthetic but consistent (prices follow
+# one value per coin), private calls check the amx signature and nonce as
+# the exchange does, and orders are matched against the order books.
+
+import argparse, base64, gzip, hashlib, hmac, io, json, random, threading, time
+from . import six
+
+BaseHTTPServer = six.moves.BaseHTTPServer
+socketserver = six.moves.socketserver
+
+# Base currencies, with a value in BTC and the smallest trade they allow
+BASES = {'BTC': (1.0, 0.0005), 'USDT': (1.0/6000, 1.0), 'NZDT': (1.0/8000, 1.0),
+         'LTC': (0.015, 0.01), 'DOGE': (3e-7, 1000.0)}
+PUBLIC_KEY = 'mock-public-key'
+PRIVATE_KEY = base64.b64encode(b'mock-private-key').decode('ascii')
+
+class APIError(Exception):
+    ''' Reported to the client as Success = false. '''
+
+class MockExchange(object):
+    ''' Synthetic currencies, trade pairs, order books and accounts, with
+        the API calls as methods. 'ncoins' altcoins are each listed
+        against 'pairs_per' of the BASES. All state is behind one lock. '''
+
+    def __init__(self, ncoins=100, pairs_per=3, depth=20, seed=0, fee=0.2, balances=None):
+        rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.depth = depth
+        self.value = dict((sym, v) for sym, (v, m) in six.iteritems(BASES))
+        for i in range(ncoins):
+            self.value['C%03d'%i] = 10**rnd.uniform(-8, -2)
+        symbols = sorted(BASES) + sorted(s for s in self.value if s not in BASES)
+        self.currencies = [{'Id': i+1, 'Name': sym, 'Symbol': sym, 'Algorithm': 'POW', 'WithdrawFee': 0.0,
+                            'MinWithdraw': 0.0, 'MinBaseTrade': 0.0, 'IsTipEnabled': False, 'MinTip': 0.0,
+                            'DepositConfirmations': 20, 'Status': 'OK', 'StatusMessage': None,
+                            'ListingStatus': 'Active'} for i, sym in enumerate(symbols)]
+        self.ids = dict((c['Symbol'], c['Id']) for c in self.currencies)
+
+        listings = [('BTC', 'USDT'), ('BTC', 'NZDT'), ('LTC', 'BTC'), ('DOGE', 'BTC'), ('LTC', 'USDT'), ('DOGE', 'LTC')]
+        others = [b for b in sorted(BASES) if b != 'BTC']
+        for sym in symbols[len(BASES):]:
+            bases = ['BTC'] + rnd.sample(others, min(max(pairs_per, 1), len(BASES)) - 1)
+            listings.extend((sym, base) for base in bases)
+        self.pairs, self.books, self.markets = {}, {}, {}
+        for Id, (sym, base) in enumerate(listings, 1):
+            self.pairs[Id] = {'Id': Id, 'Label': '%s/%s'%(sym, base), 'Currency': sym, 'Symbol': sym,
+                              'BaseCurrency': base, 'BaseSymbol': base, 'Status': 'OK', 'StatusMessage': None,
+                              'TradeFee': fee, 'MinimumTrade': 1e-8, 'MaximumTrade': 1e8,
+                              'MinimumBaseTrade': BASES[base][1], 'MaximumBaseTrade': 1e8,
+                              'MinimumPrice': 1e-8, 'MaximumPrice': 1e8}
+            mid = self.value[sym]/self.value[base] * rnd.uniform(0.98, 1.02)
+            spread = rnd.uniform(0.002, 0.03)
+            # Levels of up to 'depth', each worth 0.001 - 1 BTC
+            size = lambda: 10**rnd.uniform(-3, 0) / self.value[sym]
+            self.books[Id] = {
+                'Buy':  [[mid*(1-spread/2)*(1-0.002*k), size()] for k in range(depth)],
+                'Sell': [[mid*(1+spread/2)*(1+0.002*k), size()] for k in range(depth)]}
+            volume = 10**rnd.uniform(0, 2.5) / self.value[sym]
+            self.markets[Id] = {'TradePairId': Id, 'Label': self.pairs[Id]['Label'], 'Volume': volume,
+                                'BaseVolume': volume*mid, 'LastPrice': mid, 'Open': mid, 'Close': mid,
+                                'Low': mid*0.95, 'High': mid*1.05, 'Change': 0.0, 'BuyVolume': volume/2,
+                                'SellVolume': volume/2, 'BuyBaseVolume': volume*mid/2, 'SellBaseVolume': volume*mid/2}
+            self.quote(Id)
+
+        if balances is None:
+            # A handful of altcoins worth 0.001 - 0.05 BTC each
+            alts = symbols[len(BASES):]
+            balances = dict((sym, 10**rnd.uniform(-3, -1.3)/self.value[sym]) for sym in rnd.sample(alts, min(12, len(alts))))
+        self.accounts = {}
+        self.keys = {}
+        self.nonces = {}
+        self.addAccount(PUBLIC_KEY, PRIVATE_KEY, balances)
+        self.orders = {}
+        self.nextorder = 1
+
+    def addAccount(self, public, private, balances):
+        self.keys[public] = private
+        self.accounts[public] = dict((sym, 0.0) for sym in self.ids)
+        self.accounts[public].update(balances)
+        self.nonces[public] = 0
+
+    def quote(self, Id):
+        ''' Set the market's bid and ask from the top of its book. '''
+        book, market = self.books[Id], self.markets[Id]
+        market['BidPrice'] = book['Buy'][0][0] if book['Buy'] else 0.0
+        market['AskPrice'] = book['Sell'][0][0] if book['Sell'] else 0.0
+
+    ##### Public
+    def public(self, method, args):
+        with self.lock:
+            if method == 'GetCurrencies':
+                return self.currencies
+            if method == 'GetTradePairs':
+                return sorted(self.pairs.values(), key=lambda p: p['Id'])
+            if method == 'GetMarkets':
+                return [dict(self.markets[Id]) for Id in sorted(self.markets)]
+            if method == 'GetMarket':
+                return dict(self.markets[self.pairId(args[0])])
+            if method == 'GetMarketOrders':
+                depth = int(args[1]) if len(args) > 1 else 100
+                return self.orderBook(self.pairId(args[0]), depth)
+            if method == 'GetMarketOrderGroups':
+                depth = int(args[1]) if len(args) > 1 else 100
+                books = []
+                for Id in [self.pairId(arg) for arg in args[0].split('-')]:
+                    book = self.orderBook(Id, depth)
+                    book.update(TradePairId=Id, Market=self.pairs[Id]['Label'].replace('/', '_'))
+                    books.append(book)
+                return books
+            if method == 'GetMarketHistory':
+                return []
+        raise APIError('API Method <%s> not defined'%method)
+
+    def orderBook(self, Id, depth):
+        level = lambda price, volume: {'TradePairId': Id, 'Label': self.pairs[Id]['Label'],
+                                       'Price': price, 'Volume': volume, 'Total': price*volume}
+        return {'Buy':  [level(p, v) for p, v in self.books[Id]['Buy'][:depth]],
+                'Sell': [level(p, v) for p, v in self.books[Id]['Sell'][:depth]]}
+
+    def pairId(self, arg):
+        for Id, pair in six.iteritems(self.pairs):
+            if str(arg) in (str(Id), pair['Label'], pair['Label'].replace('/', '_')):
+                return Id
+        raise APIError('Market %s not found'%arg)
+
+    ##### Private
+    def authenticate(self, url, header, body):
+        ''' Public key for a valid 'amx' Authorization header, checking
+            the signature and that the nonce is new. '''
+        try:
+            scheme, credentials = header.split(' ', 1)
+            public, signature, nonce = credentials.split(':')
+        except ValueError:
+            raise APIError('Authorization header is invalid.')
+        if scheme != 'amx' or public not in self.keys:
+            raise APIError('Unknown API key.')
+        content = base64.b64encode(hashlib.md5(body).digest())
+        message = six.b(public + 'POST' + six.moves.urllib.parse.quote_plus(url).lower() + nonce) + content
+        expected = base64.b64encode(hmac.new(base64.b64decode(self.keys[public]), message, hashlib.sha256).digest())
+        if not hmac.compare_digest(expected, six.b(signature)):
+            raise APIError('Signature does not match request parameters.')
+        with self.lock:
+            if not nonce.isdigit() or int(nonce) <= self.nonces[public]:
+                raise APIError('Nonce has already been used for this request.')
+            self.nonces[public] = int(nonce)
+        return public
+
+    def private(self, method, public, params):
+        with self.lock:
+            account = self.accounts[public]
+            if method == 'GetBalance':
+                return self.balances(public, params.get('Currency'))
+            if method == 'SubmitTrade':
+                return self.submitTrade(public, int(params['TradePairId']), params['Type'],
+                                        float(params['Rate']), float(params['Amount']))
+            if method == 'CancelTrade':
+                return self.cancelTrade(public, params.get('Type', 'All'), params.get('OrderId'), params.get('TradePairId'))
+            if method == 'GetOpenOrders':
+                Id = params.get('TradePairId')
+                return [self.orderInfo(o) for o in self.orders.values()
+                        if o['Account'] == public and Id in (None, '', o['TradePairId'])]
+            if method in ('SubmitTransfer', 'SubmitWithdraw', 'SubmitTip'):
+                sym, amount = params['Currency'], float(params['Amount'])
+                if account.get(sym, 0.0) < amount:
+                    raise APIError('Insufficient Funds.')
+                account[sym] -= amount
+                return self.neworder()
+            if method == 'GetDepositAddress':
+                return {'Currency': params.get('Currency'), 'Address': 'mock-address', 'BaseAddress': None}
+            if method in ('GetTradeHistory', 'GetTransactions'):
+                return []
+        raise APIError('API Method <%s> not defined'%method)
+
+    def balances(self, public, currency):
+        held = {}
+        for order in self.orders.values():
+            if order['Account'] == public:
+                held[order['Held'][0]] = held.get(order['Held'][0], 0.0) + order['Held'][1]
+        rows = []
+        for sym, available in sorted(self.accounts[public].items()):
+            if currency not in (None, '', sym, self.ids[sym], str(self.ids[sym])): continue
+            rows.append({'CurrencyId': self.ids[sym], 'Symbol': sym, 'Total': available + held.get(sym, 0.0),
+                         'Available': available, 'Unconfirmed': 0.0, 'HeldForTrades': held.get(sym, 0.0),
+                         'PendingWithdraw': 0.0, 'Address': None, 'BaseAddress': None,
+                         'Status': 'OK', 'StatusMessage': None})
+        if not rows:
+            raise APIError('Currency %s not found'%currency)
+        return rows
+
+    def neworder(self):
+        self.nextorder += 1
+        return self.nextorder - 1
+
+    def submitTrade(self, public, Id, Type, rate, amount):
+        ''' Fill what the book allows at 'rate' or better; the rest rests
+            as an open order, holding its funds until cancelled. '''
+        if Id not in self.pairs: raise APIError('Market %s not found'%Id)
+        if Type not in ('Buy', 'Sell'): raise APIError('Invalid trade type.')
+        if rate <= 0 or amount <= 0: raise APIError('Invalid trade amount.')
+        pair, account = self.pairs[Id], self.accounts[public]
+        sym, base, fee = pair['Symbol'], pair['BaseSymbol'], pair['TradeFee']/100.0
+        if amount*rate < pair['MinimumBaseTrade']:
+            raise APIError('Minimum base trade is %.8f %s'%(pair['MinimumBaseTrade'], base))
+        if Type == 'Sell':
+            if account[sym] < amount: raise APIError('Insufficient Funds.')
+            account[sym] -= amount
+            filled, total = self.take(Id, 'Buy', amount, lambda price: price >= rate)
+            account[base] += total*(1.0-fee)
+            held = (sym, amount - filled)
+        else:
+            if account[base] < amount*rate*(1.0+fee): raise APIError('Insufficient Funds.')
+            filled, total = self.take(Id, 'Sell', amount, lambda price: price <= rate)
+            account[base] -= total*(1.0+fee)
+            account[sym] += filled
+            account[base] -= (amount - filled)*rate*(1.0+fee)
+            held = (base, (amount - filled)*rate*(1.0+fee))
+        market = self.markets[Id]
+        market['Volume'] += filled
+        market['BaseVolume'] += total
+        if filled > 0:
+            market['LastPrice'] = total/filled
+        if amount - filled <= 1e-8*amount:
+            return {'OrderId': None, 'FilledOrders': [self.neworder()]}
+        order = {'OrderId': self.neworder(), 'Account': public, 'TradePairId': Id, 'Type': Type,
+                 'Rate': rate, 'Amount': amount, 'Remaining': amount - filled, 'Held': held,
+                 'TimeStamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self.orders[order['OrderId']] = order
+        return {'OrderId': order['OrderId'], 'FilledOrders': [self.neworder()] if filled else []}
+
+    def take(self, Id, side, amount, acceptable):
+        ''' Consume up to 'amount' from one side of a book. Returns
+            (amount filled, base currency value). '''
+        levels = self.books[Id][side]
+        filled = total = 0.0
+        while levels and filled < amount and acceptable(levels[0][0]):
+            price, volume = levels[0]
+            take = min(volume, amount - filled)
+            filled += take
+            total += take*price
+            if take >= volume:
+                levels.pop(0)
+            else:
+                levels[0][1] -= take
+        self.quote(Id)
+        return filled, total
+
+    def cancelTrade(self, public, Type, OrderId, TradePairId):
+        cancelled = []
+        for order in list(self.orders.values()):
+            if order['Account'] != public: continue
+            if Type == 'Trade' and order['OrderId'] != OrderId: continue
+            if Type == 'TradePair' and order['TradePairId'] != TradePairId: continue
+            sym, held = order['Held']
+            self.accounts[public][sym] += held
+            del self.orders[order['OrderId']]
+            cancelled.append(order['OrderId'])
+        if Type == 'Trade' and not cancelled:
+            raise APIError('Trade #%s does not exist'%OrderId)
+        return cancelled
+
+    def orderInfo(self, order):
+        pair = self.pairs[order['TradePairId']]
+        return {'OrderId': order['OrderId'], 'TradePairId': order['TradePairId'], 'Market': pair['Label'],
+                'Type': order['Type'], 'Rate': order['Rate'], 'Amount': order['Amount'],
+                'Total': order['Amount']*order['Rate'], 'Remaining': order['Remaining'],
+                'TimeStamp': order['TimeStamp']}
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+    def do_GET(self):
+        self.dispatch(None)
+
+    def do_POST(self):
+        self.dispatch(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+
+    def dispatch(self, body):
+        server, exchange = self.server, self.server.exchange
+        if server.latency:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+        if server.error_rate and random.random() < server.error_rate:
+            return self.reply(random.choice(server.error_statuses), None, 'Injected error', {'Retry-After': '1'})
+
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) < 2 or parts[0] != 'api':
+            return self.reply(404, None, 'Not found')
+        method, args = parts[1], parts[2:]
+        try:
+            if body is None:
+                data = exchange.public(method, args)
+            else:
+                url = 'http://%s%s'%(self.headers.get('Host'), self.path)
+                public = exchange.authenticate(url, self.headers.get('Authorization') or '', body)
+                data = exchange.private(method, public, json.loads(body.decode('utf-8') or '{}'))
+        except APIError as e:
+            return self.reply(200, None, str(e))
+        except (KeyError, TypeError, ValueError) as e:
+            return self.reply(200, None, 'Bad request: %s'%e)
+        self.reply(200, data)
+
+    def reply(self, status, data, error=None, headers={}):
+        content = json.dumps({'Success': error is None, 'Message': None, 'Data': data, 'Error': error}).encode('utf-8')
+        headers = dict(headers)
+        if self.command == 'GET' and status == 200 and error is None:
+            # Public data is cacheable: honour If-None-Match, and gzip on request
+            headers['ETag'] = '"%s"'%hashlib.sha1(content).hexdigest()[:20]
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                status, content = 304, b''
+            elif 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+                headers['Content-Encoding'] = 'gzip'
+                buf = io.BytesIO()
+                with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                    f.write(content)
+                content = buf.getvalue()
+        self.send_response(status)
+        if status != 304:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+class MockServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    ''' Serves 'exchange' over HTTP, with each response delayed by about
+        'latency' seconds and a fraction 'error_rate' of requests failing
+        with one of 'error_statuses'. '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, exchange, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0,
+                 error_statuses=(503, 429), verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), Handler)
+        self.exchange = exchange
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = error_statuses
+        self.verbose = verbose
+
+    @property
+    def url(self):
+        return 'http://%s:%d/api'%self.server_address[:2]
+
+    def start(self):
+        ''' Serve from a background thread. '''
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local stand-in for the Cryptopia API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--coins', type=int, default=100, help='number of synthetic altcoins')
+    parser.add_argument('--pairs-per-coin', type=int, default=3)
+    parser.add_argument('--depth', type=int, default=20, help='order book levels per side')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='mean seconds added to each response')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests to fail')
+    parser.add_argument('--error-statuses', default='503,429', help='HTTP statuses for injected errors')
+    parser.add_argument('--balance', action='append', default=[], metavar='SYMBOL=AMOUNT',
+                        help='starting balance (repeatable); default is a random handful of altcoins')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    balances = dict((b.split('=')[0].upper(), float(b.split('=')[1])) for b in args.balance) or None
+    exchange = MockExchange(args.coins, args.pairs_per_coin, args.depth, args.seed, balances=balances)
+    server = MockServer(exchange, args.host, args.port, args.latency, args.error_rate,
+                        tuple(int(s) for s in args.error_statuses.split(',')), args.verbose)
+    six.print_('Mock Cryptopia API at %s (%d markets)'%(server.url, len(exchange.markets)))
+    six.print_('In config/teleporter.ini:\n  [Cryptopia]\n  Api_Url     = %s\n  Public_Key  = %s\n  Private_Key = %s'
+               %(server.url, PUBLIC_KEY, PRIVATE_KEY))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import os, threading
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking (e.g. on Windows); keep to one process per key
+    fcntl = None
+
+class NonceGenerator(object):
+    ''' Strictly increasing nonces for signed API calls.
+
+        Each nonce is the larger of 'clock()' and one more than the last
+        nonce issued, so any number of calls may share a clock tick. With
+        'path', the last nonce is kept in that file under an exclusive
+        lock, so processes sharing an API key never reuse one either. '''
+
+    def __init__(self, clock, path=None):
+        self.path = path
+        self.clock = clock
+        self.last = 0
+        self.lock = threading.Lock()
+
+    def issue(self):
+        with self.lock:
+            if self.path is None:
+                self.last = max(self.last + 1, self.clock())
+                return self.last
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                stored = os.read(fd, 64).strip()
+                last = max(self.last, int(stored) if stored.isdigit() else 0)
+                self.last = max(last + 1, self.clock())
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, str(self.last).encode('ascii'))
+            finally:
+                os.close(fd)
+            return self.last
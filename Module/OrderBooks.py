@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import time
+from bisect import bisect_left
+
+def _curve(levels, cost):
+    ''' Cumulative (prices, inputs, outputs) for walking 'levels' in order. '''
+    prices, inputs, outputs = [], [0.0], [0.0]
+    for level in levels:
+        price, volume = level['Price'], level['Volume']
+        if price <= 0 or volume <= 0: continue
+        prices.append(price)
+        if cost:
+            # Spending the base currency to buy 'volume' of the trade currency
+            inputs.append(inputs[-1] + price*volume)
+            outputs.append(outputs[-1] + volume)
+        else:
+            # Selling 'volume' of the trade currency for the base currency
+            inputs.append(inputs[-1] + volume)
+            outputs.append(outputs[-1] + price*volume)
+    return prices, inputs, outputs
+
+class OrderBook(object):
+    ''' Piecewise-linear fill curves for one GetMarketOrders snapshot. '''
+    def __init__(self, apidata):
+        # Bids come best (highest) first, asks best (lowest) first.
+        self.bids = _curve(apidata['Buy'], cost=False)
+        self.asks = _curve(apidata['Sell'], cost=True)
+
+    @staticmethod
+    def _walk(curve, quantity, levels):
+        prices, inputs, outputs = curve
+        if quantity > inputs[levels]: return None
+        i = bisect_left(inputs, quantity, 1, levels + 1)
+        if i > levels: return outputs[levels]
+        return outputs[i-1] + (quantity - inputs[i-1]) * (outputs[i] - outputs[i-1]) / (inputs[i] - inputs[i-1])
+
+    def sell(self, quantity, limit=0.0):
+        ''' Base currency received for selling 'quantity' of the trade
+            currency into the bids, or None if the bids priced at or above
+            'limit' can't absorb all of it. '''
+        prices = self.bids[0]
+        levels = len(prices)
+        while levels > 0 and prices[levels-1] < limit:
+            levels -= 1
+        return self._walk(self.bids, quantity, levels)
+
+    def buy(self, quantity, limit=float('inf')):
+        ''' Trade currency received for spending 'quantity' of the base
+            currency on the asks, or None if the asks priced at or below
+            'limit' can't absorb all of it. '''
+        prices = self.asks[0]
+        levels = len(prices)
+        while levels > 0 and prices[levels-1] > limit:
+            levels -= 1
+        return self._walk(self.asks, quantity, levels)
+
+class OrderBookCache(object):
+    ''' Order books keyed by TradePairId, fetched on first use and
+        kept for 'ttl' seconds. '''
+    def __init__(self, api, depth=100, ttl=30.0):
+        self.api = api
+        self.depth = depth
+        self.ttl = ttl
+        self.books = {}
+
+    def get(self, Id):
+        entry = self.books.get(Id)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            entry = (time.time(), OrderBook(self.api.getMarketOrders(Id, self.depth)))
+            self.books[Id] = entry
+        return entry[1]
+
+    def prefetch(self, Ids):
+        ''' Load every book in 'Ids' that is missing or stale, with one
+            GetMarketOrderGroups call where the API has it. '''
+        now = time.time()
+        stale = [Id for Id in sorted(set(Ids)) if Id not in self.books or now - self.books[Id][0] > self.ttl]
+        if not stale: return
+        if not hasattr(self.api, 'getMarketOrderGroups'):
+            for Id in stale:
+                self.get(Id)
+            return
+        for apidata in self.api.getMarketOrderGroups(stale, self.depth):
+            self.books[apidata['TradePairId']] = (now, OrderBook(apidata))
+
+    def discard(self, Id):
+        self.books.pop(Id, None)
+
+    def clear(self):
+        self.books = {}
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import threading, time
+
+# Unaffected by system clock changes where available (Python 3)
+clock = getattr(time, 'monotonic', time.time)
+
+class TokenBucket(object):
+    ''' Allows 'rate' calls per second on average, in bursts of up to
+        'capacity' calls, from any number of threads.
+
+        Each call takes a token. When none are left the token is borrowed
+        from the future and the caller sleeps until it would have been
+        refilled, so waiting callers are served in order. '''
+
+    def __init__(self, rate, capacity=1):
+        assert rate > 0 and capacity >= 1, 'Invalid rate limit %g/s, burst %g'%(rate, capacity)
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = self.capacity
+        self.stamp = clock()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.waited = 0.0
+
+    def reserve(self):
+        ''' Take a token now and return the seconds to wait before using
+            it, for callers that do their own sleeping. '''
+        with self.lock:
+            now = clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp)*self.rate)
+            self.stamp = now
+            self.tokens -= 1.0
+            delay = -self.tokens/self.rate if self.tokens < 0 else 0.0
+            self.calls += 1
+            self.waited += delay
+            return delay
+
+    def wait(self):
+        ''' Block until a call is allowed. Returns the seconds slept. '''
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class RateMatrix(object):
+    ''' The market graph as CSR arrays indexed by currency position.
+
+        Edge e runs from source[e] to target[e] (indptr/target are the CSR
+        adjacency) with parallel rate, fee, mintrade and volume columns,
+        matching the tuples in Commodity.neighbors. '''
+
+    def __init__(self, currencies):
+        assert np is not None, 'The numpy route backend requires NumPy.'
+        self.symbols = sorted(currencies)
+        self.index = {sym: i for i, sym in enumerate(self.symbols)}
+        source, target, rate, fee, mintrade, volume = [], [], [], [], [], []
+        for i, sym in enumerate(self.symbols):
+            for neighbor, r, f, m, v in currencies[sym].neighbors:
+                source.append(i)
+                target.append(self.index[neighbor.Symbol])
+                rate.append(r)
+                fee.append(f)
+                mintrade.append(m)
+                volume.append(v)
+        self.source = np.array(source, dtype=np.intp)
+        self.target = np.array(target, dtype=np.intp)
+        self.indptr = np.searchsorted(self.source, np.arange(len(self.symbols) + 1))
+        self.rate = np.array(rate, dtype=float)
+        self.fee = np.array(fee, dtype=float)
+        self.mintrade = np.array(mintrade, dtype=float)
+        self.volume = np.array(volume, dtype=float)
+
+        # Edges grouped by target, for reducing over each coin's inbound trades
+        order = np.argsort(self.target, kind='mergesort')
+        targets = self.target[order]
+        self.order = order
+        self.starts = np.flatnonzero(np.r_[True, targets[1:] != targets[:-1]]) if len(order) else order
+        self.heads = targets[self.starts]
+        self.feefactor = (1.0 - self.fee/100.0)[order, None]
+        self.minfill = self.mintrade[order, None]
+
+    def relax(self, Q, goal, overshoot, vol_threshold):
+        ''' One max-product step for every column of Q (coins x sources),
+            keeping only the largest quantity that reaches each coin. '''
+        Qn = np.zeros_like(Q)
+        if not len(self.order): return Qn
+        source = self.source[self.order]
+        q = Q[source]
+        ok = (q > 0) & (q * self.feefactor >= self.minfill) \
+                & (q <= (self.volume[self.order]/vol_threshold)[:, None]) & (source != goal)[:, None]
+        w = (self.rate[self.order] * (1.0-overshoot))[:, None] * self.feefactor
+        Qn[self.heads] = np.maximum.reduceat(np.where(ok, q * w, 0.0), self.starts, axis=0)
+        return Qn
+
+    def predecessor(self, Qprev, Q, node, col, goal, overshoot, vol_threshold):
+        ''' The edge that delivered Q[node, col] from the previous layer. '''
+        head = np.searchsorted(self.heads, node)
+        end = self.starts[head+1] if head + 1 < len(self.starts) else len(self.order)
+        rows = np.arange(self.starts[head], end)
+        edges = self.order[rows]
+        q = Qprev[self.source[edges], col]
+        feefactor = self.feefactor[rows, 0]
+        ok = (q > 0) & (q * feefactor >= self.minfill[rows, 0]) \
+                & (q <= self.volume[edges]/vol_threshold) & (self.source[edges] != goal)
+        match = ok & (q * (self.rate[edges] * (1.0-overshoot) * feefactor) == Q[node, col])
+        return edges[np.flatnonzero(match)[0]]
+
+    def kHopValues(self, sources, amounts, goal, maxdepth=3, overshoot=0.0, vol_threshold=20):
+        ''' Value of 'goal' reachable from each (source, amount) pair in
+            at most 'maxdepth' trades, all sources relaxed together.
+
+            This is a heuristic. Each layer keeps only the largest quantity
+            of every coin, but the volume threshold and mintrade checks can
+            make a smaller quantity the only one that gets through later
+            trades. So the value can fall short of Commodity.getRoute's,
+            at any depth. It can also exceed it, because paths are walks:
+            like Commodity.getRoute they never pass through 'goal', but a
+            coin may repeat when that pays better than any loop-free
+            route.
+
+            Returns (values, paths). '''
+        g = self.index[goal]
+        cols = np.arange(len(sources))
+        Q = np.zeros((len(self.symbols), len(sources)))
+        Q[[self.index[s] for s in sources], cols] = np.asarray(amounts, dtype=float)
+        values = np.where(np.asarray(sources) == goal, Q[g], 0.0)
+        layers = np.zeros(len(sources), dtype=np.intp)
+        Qs = [Q]
+        for hop in range(maxdepth):
+            Q = self.relax(Q, g, overshoot, vol_threshold)
+            Qs.append(Q)
+            better = Q[g] > values
+            values[better] = Q[g, better]
+            layers[better] = hop + 1
+
+        # Walk each winning value back through the stored layers
+        paths = []
+        for col in cols:
+            node, path = g, [goal]
+            for hop in range(layers[col], 0, -1):
+                edge = self.predecessor(Qs[hop-1], Qs[hop], node, col, g, overshoot, vol_threshold)
+                node = self.source[edge]
+                path.append(self.symbols[node])
+            paths.append(path[::-1] if layers[col] else ([goal] if sources[col] == goal else []))
+        return values, paths
+
+    def quantities(self, path, quantity, overshoot):
+        ''' Replay 'path' with the same arithmetic as Commodity.getRoute. '''
+        route = [(path[0], quantity)]
+        for sym, nsym in zip(path[:-1], path[1:]):
+            i, j = self.index[sym], self.index[nsym]
+            edges = np.arange(self.indptr[i], self.indptr[i+1])
+            e = edges[self.target[edges] == j][0]
+            quantity = quantity * self.rate[e] * (1.0-overshoot) * (1.0-self.fee[e]/100.0)
+            route.append((nsym, quantity))
+        return route
+
+    def bestRoutes(self, amounts, goal, maxdepth=3, overshoot=0.0, vol_threshold=20):
+        ''' Same result format as RouteGraph.bestRoutes, but not the same
+            routes: see kHopValues. Coins whose best walk repeats a coin
+            are left out of the result, since a route can't trade through
+            the same coin twice; the caller has to route them some other
+            way. '''
+        sources = [sym for sym in amounts if sym in self.index]
+        values, paths = self.kHopValues(sources, [amounts[sym] for sym in sources], goal, maxdepth, overshoot, vol_threshold)
+        result = {sym: (0.0, []) for sym in amounts}
+        for sym, path in zip(sources, paths):
+            if len(set(path)) < len(path):
+                del result[sym]
+            elif path:
+                route = self.quantities(path, amounts[sym], overshoot)
+                result[sym] = (route[-1][1], route)
+        return result
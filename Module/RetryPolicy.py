@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+import random, time
+from email.utils import parsedate_tz, mktime_tz
+
+# Calls that change account state. If one of these fails without a clear
+# answer it may still have gone through, so it is only retried when the
+# server says it turned the request away.
+UNSAFE_METHODS = set(['SubmitTrade', 'SubmitWithdraw', 'SubmitTransfer', 'SubmitTip'])
+# Statuses meaning the request was refused before being acted on
+REFUSED = set([429, 503])
+TRANSIENT = REFUSED | set([500, 502, 504])
+
+class RetryPolicy(object):
+    ''' Decides whether a failed API call is tried again, and after how
+        long: exponential backoff from 'base' seconds up to 'cap', with
+        full jitter, unless the server's Retry-After asks for longer. '''
+
+    def __init__(self, retries=3, base=0.25, cap=8.0):
+        self.retries = retries
+        self.base = base
+        self.cap = cap
+
+    def idempotent(self, method):
+        return method not in UNSAFE_METHODS
+
+    def retryable(self, method, attempt, status=None):
+        ''' Should 'method' be sent again after failing 'attempt' + 1 times,
+            with HTTP 'status', or None if no response arrived at all? '''
+        if attempt >= self.retries:
+            return False
+        if not self.idempotent(method):
+            return status in REFUSED
+        return status is None or status in TRANSIENT
+
+    def delay(self, attempt, retry_after=None):
+        ''' Seconds to wait before retry number 'attempt' (from 0). '''
+        wait = random.uniform(0, min(self.cap, self.base * 2**attempt))
+        return max(wait, parseRetryAfter(retry_after))
+
+def parseRetryAfter(value):
+    ''' Seconds asked for by a Retry-After header (delay or HTTP date). '''
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        date = parsedate_tz(value)
+        return max(0.0, mktime_tz(date) - time.time()) if date else 0.0
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import heapq, time
+from collections import OrderedDict
+from math import exp, log
+from . import six
+
+INF = float('inf')
+
+class RouteGraph(object):
+    ''' Log-space copy of the market graph for one overshoot/volume setting.
+
+        Every edge is stored as (neighbor, lograte, logmin, logcap) where
+        lograte is the log of what one unit buys after overshoot and fees,
+        and [logmin, logcap] is the range of log(quantity) that passes the
+        same 'mintrade' and volume threshold checks as Commodity.getRoute.
+
+        By default a unit buys rate*(1-overshoot)*(1-fee) as in
+        Commodity.getRoute; 'pricing(symbol, neighbor)' can give it
+        instead, e.g. to match how orders are actually sized. '''
+
+    def __init__(self, currencies, overshoot=0.0, vol_threshold=20, pricing=None):
+        self.overshoot = overshoot
+        self.vol_threshold = vol_threshold
+        self.edges = {}
+        self.inbound = {}
+        self.rates = {}
+        self.bounded = {}
+        for sym, coin in six.iteritems(currencies):
+            out = []
+            for neighbor, rate, fee, mintrade, volume in coin.neighbors:
+                if pricing is None:
+                    w = rate * (1.0-overshoot) * (1.0-fee/100.0)
+                else:
+                    w = pricing(sym, neighbor.Symbol)
+                cap = volume/vol_threshold
+                if w <= 0 or cap <= 0: continue
+                lmin = log(mintrade/(1.0-fee/100.0)) if mintrade > 0 else -INF
+                out.append((neighbor.Symbol, log(w), lmin, log(cap)))
+                self.inbound.setdefault(neighbor.Symbol, []).append((sym, log(w), lmin, log(cap)))
+                self.rates[(sym, neighbor.Symbol)] = w
+            self.edges[sym] = out
+
+    def quantities(self, path, quantity, fill=None):
+        ''' Replay 'path' at the graph's rates, or with 'fill' when routing
+            against order book depth. Returns None if 'fill' can't take a
+            trade on the path. '''
+        route = [(path[0], quantity)]
+        for sym, nsym in zip(path[:-1], path[1:]):
+            if fill is None:
+                quantity = quantity * self.rates[(sym, nsym)]
+            else:
+                quantity = fill(sym, nsym, quantity)
+                if not quantity: return None
+            route.append((nsym, quantity))
+        return route
+
+    def potentials(self, goal, maxdepth):
+        ''' bound[h][symbol] is the best log rate from 'symbol' to 'goal'
+            in at most h trades, ignoring the mintrade and volume checks. '''
+        bound = [{goal: 0.0}]
+        for hop in range(maxdepth):
+            nextbound = dict(bound[-1])
+            for sym, lr in six.iteritems(bound[-1]):
+                for psym, lw, lmin, lcap in self.inbound.get(sym, ()):
+                    if psym != goal and lr + lw > nextbound.get(psym, -INF):
+                        nextbound[psym] = lr + lw
+            bound.append(nextbound)
+        return bound
+
+    def ceilings(self, goal, bound):
+        ''' ceiling[h][symbol] is the most log quantity of 'goal' that
+            'symbol' can deliver in at most h trades, however much it
+            starts with: no trade can take more than its volume cap. '''
+        ceiling = [{goal: INF}]
+        for hop in range(len(bound) - 1):
+            nextceiling = dict(ceiling[-1])
+            for sym, lc in six.iteritems(ceiling[-1]):
+                for psym, lw, lmin, lcap in self.inbound.get(sym, ()):
+                    c = min(lcap + lw + bound[hop][sym], lc)
+                    if psym != goal and c > nextceiling.get(psym, -INF):
+                        nextceiling[psym] = c
+            ceiling.append(nextceiling)
+        return ceiling
+
+    def orders(self, bound):
+        ''' order[h][symbol] is the trades out of 'symbol' that can still
+            reach the goal in h more trades, as (lw + bound[h][neighbor],
+            neighbor, lw, lmin, lcap), best first. '''
+        order = []
+        for level in bound[:-1]:
+            order.append(dict((sym, sorted(((lw + level[nsym], nsym, lw, lmin, lcap)
+                                            for nsym, lw, lmin, lcap in out if nsym in level), reverse=True))
+                              for sym, out in six.iteritems(self.edges)))
+        return order
+
+    def bounds(self, goal, maxdepth):
+        ''' (potentials, ceilings, orders) toward 'goal', kept for the life
+            of the graph. '''
+        key = (goal, maxdepth)
+        if key not in self.bounded:
+            bound = self.potentials(goal, maxdepth)
+            self.bounded[key] = (bound, self.ceilings(goal, bound), self.orders(bound))
+        return self.bounded[key]
+
+    def search(self, start, goal, quantity, bounds, fill=None, k=1, avoid=()):
+        ''' Branch and bound over every loop-free path from 'start' to
+            'goal' of at most len(bound)-1 trades, with the same checks as
+            Commodity.getRoute. Trades are tried in the order 'bounds'
+            gives, best potential first, and a branch is dropped as soon as
+            its potential or ceiling can't beat the k-th best route found
+            so far. Neither ever underestimates what a branch can reach,
+            so the result is the exhaustive search's.
+
+            Trades in 'avoid', a set of (symbol, neighbor), are never made.
+            Leaving trades out only lowers what a branch can reach, so the
+            bounds still hold.
+
+            Returns up to 'k' [(logvalue, path), ...], best first. '''
+        bound, ceiling, order = bounds
+        found = []  # Min-heap of the k best routes so far
+        visited = set([start])
+        def floor():
+            return found[0][0] if len(found) == k else -INF
+        def visit(sym, lq, path, left):
+            for rate, nsym, lw, lmin, lcap in order[left-1].get(sym, ()):
+                if lq + rate <= floor(): break
+                if ceiling[left-1][nsym] <= floor(): continue
+                if nsym in visited or lq < lmin or lq > lcap or (sym, nsym) in avoid: continue
+                nlq = lq + lw
+                if fill is not None:
+                    nq = fill(sym, nsym, exp(lq))
+                    if not nq: continue
+                    nlq = log(nq)
+                if nsym == goal:
+                    if nlq > floor():
+                        if len(found) == k:
+                            heapq.heapreplace(found, (nlq, path + (nsym,)))
+                        else:
+                            heapq.heappush(found, (nlq, path + (nsym,)))
+                elif left > 1:
+                    visited.add(nsym)
+                    visit(nsym, nlq, path + (nsym,), left - 1)
+                    visited.discard(nsym)
+        visit(start, log(quantity), (start,), len(bound) - 1)
+        return sorted(found, reverse=True)
+
+    def bestRoute(self, start, goal, quantity, maxdepth=3, fill=None, avoid=()):
+        ''' Best route from 'start' to 'goal' in at most 'maxdepth' trades;
+            the same answer as Commodity.getRoute, found by search().
+
+            If 'fill(symbol, neighbor, quantity)' is given it prices each
+            trade instead of the top-of-book rate. It must never return
+            more than the top-of-book rate would, so that the potentials
+            still bound what a branch can reach. '''
+        if start == goal: return (quantity, [(start, quantity)])
+        if quantity <= 0 or maxdepth < 1: return (0.0, [])
+        found = self.search(start, goal, quantity, self.bounds(goal, maxdepth), fill, avoid=avoid)
+        if not found: return (0.0, [])
+        route = self.quantities(found[0][1], quantity, fill)
+        return (route[-1][1], route)
+
+    def backward(self, goal, maxdepth=3, width=16, caps=None):
+        ''' Best paths into 'goal' from every coin, in one backward pass.
+
+            Labels are (lograte, logmin, logcap, path): the log of the
+            combined rate along 'path' and the range of log(quantity) at
+            its first coin for which every trade on it passes the mintrade
+            and volume checks. Each coin keeps at most 'width' labels per
+            layer, dropping any label that another beats on rate and
+            range. Returns {symbol: labels sorted by rate}.
+
+            'caps' optionally maps (symbol, neighbor) to a lower logcap
+            for that trade, e.g. what is left after other routes. '''
+        found = {}
+        layer = {goal: [(0.0, -INF, INF, (goal,))]}
+        for hop in range(maxdepth):
+            nextlayer = {}
+            for sym, labels in six.iteritems(layer):
+                for psym, lw, lmin, lcap in self.inbound.get(sym, ()):
+                    if caps:
+                        lcap = caps.get((psym, sym), lcap)
+                    for lr, lo, hi, path in labels:
+                        if psym in path: continue
+                        nlo = max(lmin, lo - lw)
+                        nhi = min(lcap, hi - lw)
+                        if nlo > nhi: continue
+                        nextlayer.setdefault(psym, []).append((lr + lw, nlo, nhi, (psym,) + path))
+            for sym in nextlayer:
+                labels = sorted(nextlayer[sym], key=lambda l: l[0], reverse=True)
+                keep = []
+                for label in labels:
+                    if any(k[1] <= label[1] and k[2] >= label[2] for k in keep): continue
+                    keep.append(label)
+                    if len(keep) == width: break
+                nextlayer[sym] = keep
+                found.setdefault(sym, []).extend(keep)
+            layer = nextlayer
+            if not layer: break
+
+        for sym in found:
+            found[sym].sort(key=lambda l: l[0], reverse=True)
+        return found
+
+    def bestRoutes(self, amounts, goal, maxdepth=3, k=None, avoid=()):
+        ''' Best route to 'goal' for every {symbol: quantity} in 'amounts',
+            exactly the route bestRoute would find. This is still one
+            search() per coin: what a route can carry depends on the
+            coin's own quantity, so routes aren't shared. What is shared,
+            and kept for the life of the graph, is everything that doesn't
+            depend on the quantity: the potentials, the ceilings and the
+            order each coin's trades are tried in.
+
+            With 'k', each symbol instead gets a list of its k best
+            loop-free routes, best first. '''
+        bounds = self.bounds(goal, maxdepth) if maxdepth >= 1 else None
+        result = {}
+        for sym, quantity in six.iteritems(amounts):
+            routes = []
+            if sym == goal:
+                routes = [(quantity, [(sym, quantity)])]
+            elif bounds and quantity > 0:
+                for lq, path in self.search(sym, goal, quantity, bounds, k=k or 1, avoid=avoid):
+                    route = self.quantities(path, quantity)
+                    routes.append((route[-1][1], route))
+            if k:
+                result[sym] = routes
+            else:
+                result[sym] = routes[0] if routes else (0.0, [])
+        return result
+
+    def splitRoutes(self, start, goal, quantity, maxdepth=3, width=16, maxroutes=4):
+        ''' Up to 'maxroutes' routes that together trade at most 'quantity'
+            of 'start' for 'goal' without any trade exceeding its volume
+            threshold.
+
+            Greedy augmenting paths: the best-rate route that can take any
+            of what is left gets as much as its tightest trade allows, that
+            volume is taken off every trade it used, and the search runs
+            again. Returns [(value, route), ...] in the order found; their
+            starting quantities may add up to less than 'quantity' if the
+            markets can't absorb it all. '''
+        if start == goal: return [(quantity, [(start, quantity)])]
+        caps = {}
+        slices = []
+        remaining = quantity
+        while remaining > quantity*1e-9 and len(slices) < maxroutes:
+            lq = log(remaining)
+            for lr, lo, hi, path in self.backward(goal, maxdepth, width, caps).get(start, ()):
+                if lo <= min(lq, hi): break
+            else:
+                break
+            route = self.quantities(path, min(remaining, exp(hi)))
+            slices.append((route[-1][1], route))
+            remaining -= route[0][1]
+            for (sym, qty), (nsym, nqty) in zip(route[:-1], route[1:]):
+                if (sym, nsym) not in caps:
+                    caps[(sym, nsym)] = [lcap for n, lw, lmin, lcap in self.edges[sym] if n == nsym][0]
+                left = exp(caps[(sym, nsym)]) - qty
+                caps[(sym, nsym)] = log(left) if left > qty*1e-9 else -INF
+        return slices
+
+class RouteCache(object):
+    ''' Least-recently-used cache of (value, route) results, bounded to
+        'maxsize' entries that expire 'ttl' seconds after they are stored. '''
+
+    def __init__(self, maxsize=256, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+        self.entries[key] = entry
+        return entry[1]
+
+    def put(self, key, result):
+        self.entries.pop(key, None)
+        self.entries[key] = (time.time(), result)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, edges):
+        ''' Drop every cached route that trades along one of 'edges'. '''
+        for key in list(self.entries):
+            result = self.entries[key][1]
+            for value, route in (result if isinstance(result, list) else [result]):
+                coins = [coin for coin, qty in route]
+                if any(hop in edges for hop in zip(coins[:-1], coins[1:])):
+                    del self.entries[key]
+                    break
+
+    def clear(self):
+        self.entries.clear()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import json, os, time
+
+# Bump whenever the stored layout changes; older files are then ignored.
+SNAPSHOT_VERSION = 1
+
+def record(obj, fields):
+    return {f: getattr(obj, f) for f in fields}
+
+def load(path):
+    ''' Snapshot dict stored at 'path', or None if there is no usable one. '''
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+def fresh(snapshot, key, ttl):
+    ''' True if 'key' is stored in 'snapshot' and is younger than 'ttl' seconds. '''
+    return snapshot is not None and key in snapshot \
+            and 0 <= time.time() - snapshot[key]['time'] < ttl
+
+def save(path, **sections):
+    ''' Write {name: (time, data)} sections to 'path', replacing the file
+        by renaming a temporary file so a crash can't leave half a
+        snapshot behind. '''
+    snapshot = {'version': SNAPSHOT_VERSION}
+    for name, (stamp, data) in sections.items():
+        snapshot[name] = {'time': stamp, 'data': data}
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        if hasattr(os, 'replace'):
+            os.replace(tmp, path)
+        else:
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(tmp, path)
+    except (IOError, OSError):
+        pass
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+'''
+    Copyright 2017 jphxyz
+
+    This file is part of Teleporter.
+
+    Teleporter is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Teleporter is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with Teleporter.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+
+# Transports carry CryptopiaWrapper's HTTP requests. Anything with
+# ConnectionPool.request's signature will do; the ones here record a
+# session to a gzipped JSON-lines file and play it back later, e.g. to
+# profile the router and executor against a real run, offline.
+
+import atexit, gzip, io, json, threading, time
+from collections import deque
+
+REDACTED = 'REDACTED'
+# Request headers that carry credentials
+SECRET_HEADERS = ('authorization',)
+
+class Tee(object):
+    ''' Response wrapper that keeps a copy of everything read from it. '''
+    def __init__(self, response):
+        self.response = response
+        self.chunks = []
+
+    def read(self, *args):
+        data = self.response.read(*args)
+        self.chunks.append(data)
+        return data
+
+class RecordingTransport(object):
+    ''' Passes requests on to 'transport' and writes each one, with its
+        response or error and timing, as a line of 'path'. Credentials
+        in the request headers are redacted before writing. '''
+
+    def __init__(self, transport, path):
+        self.transport = transport
+        self.file = gzip.open(path, 'wb')
+        self.lock = threading.Lock()
+        self.start = time.time()
+        atexit.register(self.close)
+
+    def request(self, method, path, body=None, headers={}, retry=True, consume=None):
+        entry = {'method': method, 'path': path, 'body': body.decode('utf-8') if body else body,
+                 'headers': dict((k, REDACTED if k.lower() in SECRET_HEADERS else v) for k, v in headers.items()),
+                 'time': time.time() - self.start}
+        tees = []
+        def tee(response):
+            tees.append(Tee(response))
+            return consume(tees[-1])
+        try:
+            status, rheaders, data = self.transport.request(method, path, body, headers, retry,
+                                                            tee if consume is not None else None)
+        except Exception as e:
+            entry.update(elapsed=time.time() - self.start - entry['time'], error=str(e))
+            self.write(entry)
+            raise
+        raw = b''.join(tees[-1].chunks) if tees and status == 200 else data
+        entry.update(elapsed=time.time() - self.start - entry['time'], status=status,
+                     response_headers=rheaders, response=raw.decode('utf-8'))
+        self.write(entry)
+        return status, rheaders, data
+
+    def write(self, entry):
+        with self.lock:
+            if self.file is not None:
+                self.file.write((json.dumps(entry, sort_keys=True) + '\n').encode('utf-8'))
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class ReplayTransport(object):
+    ''' Answers requests from a file written by RecordingTransport.
+
+        Each request gets the next recorded response to the same method,
+        path and body, so a run that makes the same calls sees exactly
+        the same data. With 'latency', each response also takes as long
+        as it did when recorded, times 'latency'. '''
+
+    def __init__(self, path, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.entries = {}
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                entry = json.loads(line.decode('utf-8'))
+                self.entries.setdefault(self.key(entry['method'], entry['path'], entry['body']), deque()).append(entry)
+
+    @staticmethod
+    def key(method, path, body):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        return (method, path, body)
+
+    def request(self, method, path, body=None, headers={}, retry=True, consume=None):
+        with self.lock:
+            queue = self.entries.get(self.key(method, path, body))
+            entry = queue.popleft() if queue else None
+        if entry is None:
+            raise IOError('No recorded response for %s %s'%(method, path))
+        if self.latency:
+            time.sleep(entry['elapsed'] * self.latency)
+        if 'error' in entry:
+            raise IOError(entry['error'])
+        data = entry['response'].encode('utf-8')
+        if consume is not None and entry['status'] == 200:
+            data = consume(io.BytesIO(data))
+        return entry['status'], entry['response_headers'], data
@@ -20,11 +20,13 @@
 '''
 
 import json, os, sys, time
-from decimal import ROUND_UP, ROUND_DOWN
 from decimal import Decimal as Dec
 from datetime import datetime
 from Module import six
+from Module.ConnectionPool import ConnectionPool
 from Module.CryptopiaWrapper import CryptopiaWrapper
+from Module.FixedPoint import toUnits, fromUnits
+from Module.Transport import RecordingTransport, ReplayTransport
 import Module.Markets as markets
 
 class Logger(object):
@@ -66,15 +68,27 @@ ConfDict        = config.__dict__['_sections']
 DryRun          = (ConfDict['Main_Settings']['dry_run'].lower() in ('y', 'yes', '1', 'true'))
 DonateFraction  = float(ConfDict['Main_Settings']['donate_percent'])/100.0
 LogFile         = ConfDict['Main_Settings']['log_file']
+SnapshotFile    = ConfDict['Main_Settings'].get('snapshot_file', '')
+SnapshotHours   = float(ConfDict['Main_Settings'].get('snapshot_hours', '24'))
 BuyCoin         = ConfDict['Trade_Settings']['coin_to_buy']
 SellFraction    = float(ConfDict['Trade_Settings']['sell_percent_of_available_balance'])/100.0
 MaxTrades       = int(ConfDict['Trade_Settings']['max_trades'])
 RateOvershoot   = float(ConfDict['Trade_Settings']['rate_overshoot'])/100.0
 TradeTimeout    = float(ConfDict['Trade_Settings']['open_trade_timeout'])
 VolumeThreshold = float(ConfDict['Trade_Settings']['volume_threshold'])
+DepthRouting    = (ConfDict['Trade_Settings'].get('depth_aware_routing', 'false').lower() in ('y', 'yes', '1', 'true'))
+FailoverRoutes  = int(ConfDict['Trade_Settings'].get('failover_routes', '2'))
+SplitRoutes     = int(ConfDict['Trade_Settings'].get('split_routes', '1'))
+ReportArbitrage = (ConfDict['Trade_Settings'].get('report_arbitrage', 'false').lower() in ('y', 'yes', '1', 'true'))
 StopBalances    = {k.upper(): float(v) for k, v in six.iteritems(ConfDict['Keep_Balance']) if k not in ('symbol', '__name__')}
 PublicKey       = ConfDict['Cryptopia']['public_key']
 PrivateKey      = ConfDict['Cryptopia']['private_key']
+ApiUrl          = ConfDict['Cryptopia'].get('api_url', 'https://www.cryptopia.co.nz/api')
+PublicRate      = float(ConfDict['Cryptopia'].get('public_requests_per_second', '5'))
+PublicBurst     = int(ConfDict['Cryptopia'].get('public_burst', '5'))
+PrivateRate     = float(ConfDict['Cryptopia'].get('private_requests_per_second', '5'))
+PrivateBurst    = int(ConfDict['Cryptopia'].get('private_burst', '3'))
+NonceFile       = ConfDict['Cryptopia'].get('nonce_file', '')
 AutoWithdraw      = (ConfDict['Withdraw']['auto_withdraw'].lower() in ('y', 'yes', '1', 'true'))
 WithdrawCoin      = ConfDict['Withdraw']['withdraw_currency']
 WithdrawAddress   = ConfDict['Withdraw']['withdraw_address']
@@ -83,7 +97,8 @@ WithdrawThreshold = ConfDict['Withdraw']['withdraw_threshold']
 
 # Check for CLI options (override config file options if so)
 if '-h' in sys.argv or '--help' in sys.argv:
-    six.print_('Usage: teleporter [-h|--help] [-n|--dry-run] [-c|--coin <COIN>] [-m|--max-trades <MAX_TRADES>]')
+    six.print_('Usage: teleporter [-h|--help] [-n|--dry-run] [-c|--coin <COIN>] [-m|--max-trades <MAX_TRADES>]\n'
+               '                  [--record <FILE>] [--replay <FILE>]')
     sys.exit()
 if '-n' in sys.argv or '--dry-run' in sys.argv:
     DryRun = True
@@ -96,7 +111,17 @@ if '-m' in sys.argv:
 if '--max-trades' in sys.argv:
     MaxTrades = int(sys.argv[sys.argv.index('--max-trades')+1])
 
-api = CryptopiaWrapper(PublicKey, PrivateKey)
+# Record the session's API traffic, or answer it from an earlier recording
+transport = None
+if '--record' in sys.argv:
+    transport = RecordingTransport(ConnectionPool(ApiUrl.rstrip('/')), sys.argv[sys.argv.index('--record')+1])
+if '--replay' in sys.argv:
+    transport = ReplayTransport(sys.argv[sys.argv.index('--replay')+1])
+
+api = CryptopiaWrapper(PublicKey, PrivateKey, public_rate=PublicRate, public_burst=PublicBurst,
+        private_rate=PrivateRate, private_burst=PrivateBurst,
+        nonce_file=os.path.join(sys.path[0], NonceFile) if NonceFile else None, base_url=ApiUrl,
+        transport=transport)
 
 # Dramatic startup messages
 zzz = 0.07
@@ -150,9 +175,21 @@ if len(available.keys()) == 0:
 
 # Initialize Network object (Queries info on all coins, tradepairs, and markets)
 six.print_('Initializing Market Network...', end=' ', flush=True)
-net = markets.Network(api)
+if SnapshotFile:
+    SnapshotFile = os.path.join(sys.path[0], SnapshotFile)
+net = markets.Network(api, snapshot=SnapshotFile or None, snapshot_ttl=SnapshotHours*3600.0)
 six.print_('\033[92m'+'OK'+'\033[0m'+'\n')
 
+def reportArbitrage():
+    loops = net.findArbitrage(BuyCoin, RateOvershoot, VolumeThreshold, MaxTrades)
+    for profit, loop in loops[:3]:
+        six.print_('Arbitrage loop (%+.2f%%): %s'%(profit*100, ' -> '.join(['[%s]'%(coin) for coin, qty in loop])))
+    if loops:
+        six.print_('')
+
+if ReportArbitrage:
+    reportArbitrage()
+
 def getAvailable(coin):
     try:
         return api.getBalance(coin)[0]['Available']
@@ -167,7 +204,7 @@ def doTrade(pairId, trade_type, rate, amount, tocoin, amount_tocoin, timeout=Tra
         return (True, {'OrderId': 0})
     else:
         initial_tocoin_bal = getAvailable(tocoin)
-        result = api.submitTrade(pair.Id, trade_type, float(rate), float(trade_amount))
+        result = api.submitTrade(pairId, trade_type, float(rate), float(amount))
 
         time.sleep(2)
 
@@ -181,24 +218,55 @@ def doTrade(pairId, trade_type, rate, amount, tocoin, amount_tocoin, timeout=Tra
         else:
             return (True, result)
 
-def precision(decimal, precision, rounding=None):
-    if precision < 1:
-        return Dec(int(decimal))
-
-    return decimal.quantize(Dec('0.'+('0'*(precision-1))+'1'), rounding=rounding)
-
 # TODO: Split most of the rest into a few smaller functions
 
+def sellAmounts(available):
+    amounts = {}
+    for coin, value in six.iteritems(available):
+        amounts[coin] = value * SellFraction
+        if coin in StopBalances:
+            amounts[coin] -= StopBalances[coin]
+    return amounts
+
+def nextRoute(fromcoin, amount, avoid, planned=None):
+    ''' Best route from 'fromcoin' that trades on none of the
+        markets in 'avoid'. Tries the 'planned' alternatives first,
+        then searches the current market graph for the best route
+        around those markets. '''
+    for value, route in planned or ():
+        if len(route) > 1 and not net.routeChanged(route, avoid):
+            return route
+    value, route = net.getBestRoute(fromcoin, BuyCoin, float(amount), MaxTrades, RateOvershoot, VolumeThreshold, avoid=avoid)
+    return route if len(route) > 1 else None
+
+def planTrades(amounts):
+    ''' [(coin, amount, planned routes), ...] for every {coin: amount}.
+        One backward search from BuyCoin plans a route, plus alternatives
+        to fail over to, for every coin at once. With SplitRoutes, a coin
+        too large for one route's markets is cut into one entry per route. '''
+    routes = net.getBestRoutes(amounts, BuyCoin, MaxTrades, RateOvershoot, VolumeThreshold, k=FailoverRoutes+1)
+    plan = []
+    for coin, amount in six.iteritems(amounts):
+        if SplitRoutes > 1 and not DepthRouting:
+            slices = net.splitRoute(coin, BuyCoin, amount, MaxTrades, RateOvershoot, VolumeThreshold, SplitRoutes)
+            if len(slices) > 1:
+                plan.extend((coin, route[0][1], [(value, route)]) for value, route in slices)
+                continue
+        plan.append((coin, amount, routes[coin]))
+    return plan
+
 total_converted = Dec(0)
-to_trade = [(coin, value) for coin, value in six.iteritems(available)]
+to_trade = planTrades(sellAmounts(available))
+# Markets (both directions) where one of our orders has timed out this run
+avoid = set()
 while len(to_trade) > 0:
-    sellcoin, amt_to_sell = to_trade.pop()
-    amt_to_sell *= SellFraction
-    if sellcoin in StopBalances:
-        amt_to_sell -= StopBalances[sellcoin]
+    sellcoin, amt_to_sell, alternatives = to_trade.pop()
 
     # Establish route
-    final_value, route_info = net.getBestRoute(sellcoin, BuyCoin, amt_to_sell, MaxTrades, RateOvershoot, VolumeThreshold)
+    if DepthRouting:
+        final_value, route_info = net.getBestRoute(sellcoin, BuyCoin, amt_to_sell, MaxTrades, RateOvershoot, VolumeThreshold, depth=True, avoid=avoid)
+    else:
+        route_info = nextRoute(sellcoin, amt_to_sell, avoid, alternatives) or []
 
     if len(route_info) <= 1:
         # If no routes were found (happens when balances are
@@ -211,14 +279,17 @@ while len(to_trade) > 0:
 
     # The following loop counts on knowing how much was aquired in the previous
     # trade (adjusted for fees and whatnot). On the first iteration it should be set
-    # to the number of input coins to sell.
-    value_of_previous_transaction = Dec(amt_to_sell)
+    # to the number of input coins to sell. Amounts are in 1e-8 units, see FixedPoint.
+    value_of_previous_transaction = toUnits(amt_to_sell)
 
     # Now execute trades
     route = [coin for coin, qty in route_info]
     failed_route = False
-    for fromcoin, tocoin in zip(route[:-1], route[1:]):
-        pair = net.getTradePair(fromcoin, tocoin)
+    hops = list(zip(route[:-1], route[1:]))
+    while hops:
+        fromcoin, tocoin = hops.pop(0)
+        pair, trade_type, rate, trade_amount, amount_of_output_currency = \
+                net.sizeTrade(fromcoin, tocoin, value_of_previous_transaction, RateOvershoot)
         trade_symbol = pair.Symbol
         base_symbol   = pair.BaseSymbol
         assert (fromcoin in (trade_symbol, base_symbol)) \
@@ -227,8 +298,8 @@ while len(to_trade) > 0:
 
         if not DryRun:
             bal = api.getBalance(fromcoin)[0]
-            assert bal['Available'] >= value_of_previous_transaction, \
-                '  Unable to trade %g %s for %s.'%(value_of_previous_transaction, fromcoin, tocoin) \
+            assert bal['Available'] >= fromUnits(value_of_previous_transaction), \
+                '  Unable to trade %g %s for %s.'%(fromUnits(value_of_previous_transaction), fromcoin, tocoin) \
                 + '\n  Insufficient available funds.'
 
         # For reference, because I always get turned around here:
@@ -269,50 +340,46 @@ while len(to_trade) > 0:
         # for the trade amount on Sell orders, but they do on Buy orders. But in
         # both cases they are taken out of the trade. That means that Buy orders
         # must leave little bits of change in the source account.
-
-        market = net.getMarket(pair.Id)
-
-        amount_of_input_currency = value_of_previous_transaction
-        amount_of_input_currency  = precision(amount_of_input_currency, 8, ROUND_DOWN)
-
-        if fromcoin == trade_symbol:
-            trade_type = 'Sell'
-            rate = precision(Dec(market['BidPrice'] * (1.0 - RateOvershoot)), 8, ROUND_DOWN)
-            assert rate > 0, 'Rate is below precision'
-            trade_amount = amount_of_input_currency # Measured in the trade currency (this one)
-            trade_amount = precision(trade_amount, 8, ROUND_DOWN)
-            amount_of_output_currency = amount_of_input_currency * rate * (Dec(1) - Dec(pair.TradeFee)/Dec(100))
-            amount_of_output_currency = precision(amount_of_output_currency, 8, ROUND_DOWN)
-        else:
-            trade_type = 'Buy'
-            rate = precision(Dec(market['AskPrice'] * (1.0 + RateOvershoot)), 8, ROUND_UP)
-            assert rate > 0, 'Rate is below precision'
-            trade_amount = amount_of_input_currency/rate/(Dec(1) + Dec(pair.TradeFee)/Dec(100))
-            trade_amount = precision(trade_amount, 8, ROUND_DOWN)
-            # I think this is a bug in the API that forces us to leave little bits of change
-            # in the source account on Buy orders.
-            amount_of_output_currency = trade_amount * (Dec(1) - Dec(pair.TradeFee)/Dec(100))
+        #
+        # net.sizeTrade does all of that in whole 1e-8 units (the precision
+        # the exchange accepts): sell rates round down, buy rates round up,
+        # and Buy amounts leave room for the fee, so the amounts below are
+        # exactly what the route search planned with.
+        assert rate > 0, 'Rate is below precision'
 
         # Submit trade
         if DryRun:
             six.print_('\033[93m' + 'DRY RUN:' + '\033[0m', end='')
-        six.print_('  Submitting %4s order: %g %4s -> %g %4s ...'%(trade_type, amount_of_input_currency, \
-                fromcoin, amount_of_output_currency, tocoin), end='', flush=True)
+        six.print_('  Submitting %4s order: %g %4s -> %g %4s ...'%(trade_type, fromUnits(value_of_previous_transaction), \
+                fromcoin, fromUnits(amount_of_output_currency), tocoin), end='', flush=True)
 
-        success, result = doTrade(pair.Id, trade_type, rate, trade_amount, tocoin, amount_of_output_currency)
+        success, result = doTrade(pair.Id, trade_type, fromUnits(rate), fromUnits(trade_amount), tocoin, fromUnits(amount_of_output_currency))
 
         if success:
             six.print_('\033[92m'+'  OK'+'\033[0m')
         else:
-            failed_trade = True
-            six.print_('\033[91m'+'  Trade timed out.'+'\033[0m'+' Canceling and recomputing route.')
+            six.print_('\033[91m'+'  Trade timed out.'+'\033[0m'+' Canceling and failing over.')
             orderId = result['OrderId']
             try:
                 api.cancelTrade('All', orderId, '')
             except AssertionError as e:
                 six.print_('  Cancel trade failed with error:', end=' ')
                 six.print_(e)
-            break
+
+            # Switch to the next-best route from wherever we are now
+            # that avoids every market that has timed out on us.
+            avoid.update([(fromcoin, tocoin), (tocoin, fromcoin)])
+            value_of_previous_transaction = min(value_of_previous_transaction, toUnits(getAvailable(fromcoin)))
+            planned = alternatives if (fromcoin == sellcoin and value_of_previous_transaction == toUnits(amt_to_sell)) else None
+            route = nextRoute(fromcoin, fromUnits(value_of_previous_transaction), avoid, planned)
+            if route is None:
+                failed_route = True
+                six.print_('  No alternative route. Recomputing routes.')
+                break
+            route = [coin for coin, qty in route]
+            six.print_('  Failing over to route: %s'%(' -> '.join(['[%s]'%(coin) for coin in route])))
+            hops = list(zip(route[:-1], route[1:]))
+            continue
 
         value_of_previous_transaction = amount_of_output_currency
 
@@ -323,14 +390,18 @@ while len(to_trade) > 0:
         six.print_('\033[92m'+'OK'+'\033[0m'+'\n')
 
         available = {b['Symbol']:b['Available'] for b in api.getBalance('') if istradeable(b)}
-        to_trade = [(coin, value) for coin, value in six.iteritems(available)]
-        net.initialize()
+        net.refresh(pairs=True)
+        if ReportArbitrage:
+            reportArbitrage()
+        to_trade = planTrades(sellAmounts(available))
         failed_route = False
     else:
-        total_converted += value_of_previous_transaction
+        total_converted += fromUnits(value_of_previous_transaction)
 
     six.print_('')
 
+six.print_('Waited %.1f s on API rate limits.\n'%api.rateLimitWait())
+
 if total_converted == 0:
     six.print_('No routes found.')
     sys.exit(0)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+
+'''
+    Checks of the 1e-8 unit arithmetic in Module/FixedPoint.py. Run with
+
+        python -m unittest discover tests
+'''
+
+import unittest
+from decimal import Decimal as Dec
+from Module import FixedPoint
+
+class FeeTest(unittest.TestCase):
+    def test_fee_units_are_exact(self):
+        for fee in (0.1, 0.15, 0.2, 0.25, 0.3, 0.5, 0.7, 2.0):
+            self.assertEqual(FixedPoint.feeUnits(fee), int(Dec(repr(fee)) * FixedPoint.UNIT))
+
+    def test_sell_fee_is_not_understated(self):
+        # 1 coin sold at 1.0 with a 0.3% fee leaves exactly 0.997
+        rate, amount, output = FixedPoint.sellOrder(FixedPoint.UNIT, 1.0, 0.3, 0.0)
+        self.assertEqual(output, 99700000)
+
+    def test_buy_fee_is_not_understated(self):
+        rate, amount, output = FixedPoint.buyOrder(FixedPoint.UNIT, 1.0, 0.7, 0.0)
+        self.assertEqual(amount, 10**26 // (10**8 * 10070000000))
+        self.assertEqual(output, amount * 9930000000 // 10**10)
+
+if __name__ == '__main__':
+    unittest.main()
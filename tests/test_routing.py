@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+'''
+    Randomized checks of the route engines in Module/Routing.py and the
+    loop search in Module/Arbitrage.py against exhaustive searches. Run
+    with
+
+        python -m unittest discover tests
+'''
+
+import random, unittest
+from Module.Markets import Commodity
+from Module.Routing import RouteGraph
+from Module.Arbitrage import findCycles
+from Module.RateMatrix import RateMatrix, np
+
+def hubNetwork(seed, nbase=5, nalt=60, pairs_per=3):
+    ''' {symbol: Commodity} for a synthetic exchange where every altcoin
+        trades against a few base coins and the bases trade with each
+        other, with volumes spread widely enough that the volume
+        threshold and mintrade checks often bind. '''
+    rng = random.Random(seed)
+    bases = ['B%d'%i for i in range(nbase)]
+    alts = ['A%d'%i for i in range(nalt)]
+    coins = {}
+    for Id, sym in enumerate(bases + alts):
+        coins[sym] = Commodity({'Id': Id, 'Name': sym, 'Symbol': sym, 'MinBaseTrade': 0.0,
+                                'IsTipEnabled': False, 'MinTip': 0.0, 'Status': 'OK'})
+    markets = [(a, b) for i, a in enumerate(bases) for b in bases[i+1:]]
+    for alt in alts:
+        markets += [(alt, base) for base in rng.sample(bases, pairs_per)]
+    for sym, base in markets:
+        bid = 10 ** rng.uniform(-2, 2)
+        ask = bid * rng.uniform(1.001, 1.05)
+        fee = rng.choice((0.1, 0.2, 0.5))
+        minbase = 10 ** rng.uniform(-3, 0)
+        volume = 10 ** rng.uniform(0, 4)
+        coins[sym].addneighbor(coins[base], bid, fee, minbase/bid, volume)
+        coins[base].addneighbor(coins[sym], 1.0/ask, fee, minbase, volume * bid * rng.uniform(0.5, 2))
+    return coins
+
+def allRoutes(coins, start, goal, quantity, maxdepth, overshoot, vol_threshold, avoid=()):
+    ''' Value of every route Commodity.getRoute considers that makes none
+        of the trades in 'avoid', best first. '''
+    values = []
+    def visit(coin, quantity, path):
+        for neighbor, rate, fee, mintrade, volume in coin.neighbors:
+            if neighbor.Symbol in path or (coin.Symbol, neighbor.Symbol) in avoid: continue
+            if quantity * (1.0 - fee/100.0) < mintrade or quantity > volume/vol_threshold: continue
+            Q = quantity * rate * (1.0-overshoot) * (1.0-fee/100.0)
+            if neighbor.Symbol == goal:
+                values.append(Q)
+            elif len(path) < maxdepth:
+                visit(neighbor, Q, path + [neighbor.Symbol])
+    visit(coins[start], quantity, [start])
+    return sorted(values, reverse=True)
+
+def allCycles(coins, coin, quantity, maxlen, overshoot, vol_threshold):
+    ''' {path: profit} for every loop through 'coin' of at most 'maxlen'
+        trades that gains, and that passes Commodity.getRoute's checks
+        unless 'quantity' is None. '''
+    cycles = {}
+    def visit(node, Q, path):
+        for neighbor, rate, fee, mintrade, volume in node.neighbors:
+            if quantity and (Q * (1.0 - fee/100.0) < mintrade or Q > volume/vol_threshold): continue
+            nQ = Q * rate * (1.0-overshoot) * (1.0-fee/100.0)
+            if neighbor.Symbol == coin:
+                cycles[tuple(path) + (coin,)] = nQ
+            elif neighbor.Symbol not in path and len(path) < maxlen:
+                visit(neighbor, nQ, path + [neighbor.Symbol])
+    start = quantity or 1.0
+    visit(coins[coin], start, [coin])
+    return dict((path, Q/start - 1.0) for path, Q in cycles.items() if Q > start)
+
+def queries(coins, seed, n):
+    rng = random.Random(seed)
+    symbols = sorted(coins)
+    for i in range(n):
+        start, goal = rng.sample(symbols, 2)
+        yield start, goal, 10 ** rng.uniform(-1, 2)
+
+class BestRouteTest(unittest.TestCase):
+    def assertSameValue(self, value, expected, query):
+        self.assertAlmostEqual(value, expected, delta=1e-9 * max(1.0, expected), msg=repr(query))
+
+    def test_matches_exhaustive_search(self):
+        for seed in range(10):
+            coins = hubNetwork(seed)
+            graph = RouteGraph(coins, overshoot=0.01, vol_threshold=20)
+            for maxdepth in (3, 4, 5, 6):
+                for start, goal, quantity in queries(coins, seed * 10 + maxdepth, 12):
+                    expected, route = coins[start].getRoute(quantity, goal, maxdepth=maxdepth,
+                                                            overshoot=0.01, vol_threshold=20)
+                    value, found = graph.bestRoute(start, goal, quantity, maxdepth=maxdepth)
+                    self.assertSameValue(value, expected, (seed, maxdepth, start, goal, quantity))
+                    if found:
+                        self.assertLessEqual(len(found) - 1, maxdepth)
+                        self.assertEqual(len(set(sym for sym, qty in found)), len(found))
+
+    def test_batch_matches_exhaustive_search(self):
+        for seed in range(6):
+            coins = hubNetwork(seed)
+            graph = RouteGraph(coins, overshoot=0.01, vol_threshold=20)
+            rng = random.Random(seed)
+            for maxdepth in (3, 4, 5):
+                goal = rng.choice(sorted(coins))
+                amounts = {sym: 10 ** rng.uniform(-1, 2) for sym in rng.sample(sorted(coins), 30)}
+                found = graph.bestRoutes(amounts, goal, maxdepth=maxdepth)
+                for sym, quantity in amounts.items():
+                    expected, route = coins[sym].getRoute(quantity, goal, maxdepth=maxdepth,
+                                                          overshoot=0.01, vol_threshold=20)
+                    self.assertSameValue(found[sym][0], expected, (seed, maxdepth, sym, goal, quantity))
+
+    def test_alternatives(self):
+        coins = {}
+        for Id, sym in enumerate(('A', 'BTC', 'LTC', 'ETH')):
+            coins[sym] = Commodity({'Id': Id, 'Name': sym, 'Symbol': sym, 'MinBaseTrade': 0.0,
+                                    'IsTipEnabled': False, 'MinTip': 0.0, 'Status': 'OK'})
+        for sym, base, rate, volume in (('A', 'BTC', 2.0, 100.0), ('A', 'LTC', 1.5, 100.0),
+                                        ('BTC', 'ETH', 3.0, 1e6), ('LTC', 'ETH', 3.0, 1e6)):
+            coins[sym].addneighbor(coins[base], rate, 0.2, 0.0, volume)
+        graph = RouteGraph(coins)
+        routes = graph.bestRoutes({'A': 1.0}, 'ETH', maxdepth=2, k=3)['A']
+        self.assertEqual([[sym for sym, qty in route] for value, route in routes],
+                         [['A', 'BTC', 'ETH'], ['A', 'LTC', 'ETH']])
+
+    def test_k_best_match_exhaustive_search(self):
+        for seed in range(6):
+            coins = hubNetwork(seed)
+            graph = RouteGraph(coins, overshoot=0.01, vol_threshold=20)
+            for maxdepth in (3, 4):
+                for start, goal, quantity in queries(coins, seed * 10 + maxdepth, 8):
+                    expected = allRoutes(coins, start, goal, quantity, maxdepth, 0.01, 20)[:5]
+                    routes = graph.bestRoutes({start: quantity}, goal, maxdepth=maxdepth, k=5)[start]
+                    self.assertEqual(len(routes), len(expected))
+                    for (value, route), best in zip(routes, expected):
+                        self.assertSameValue(value, best, (seed, maxdepth, start, goal, quantity))
+                    self.assertEqual(len(set(tuple(route) for value, route in routes)), len(routes))
+
+    def test_avoid(self):
+        for seed in range(6):
+            coins = hubNetwork(seed)
+            graph = RouteGraph(coins, overshoot=0.01, vol_threshold=20)
+            for start, goal, quantity in queries(coins, seed, 20):
+                value, route = graph.bestRoute(start, goal, quantity, maxdepth=4)
+                if len(route) < 2: continue
+                avoid = set([(route[0][0], route[1][0]), (route[1][0], route[0][0])])
+                expected = allRoutes(coins, start, goal, quantity, 4, 0.01, 20, avoid)
+                value, route = graph.bestRoute(start, goal, quantity, maxdepth=4, avoid=avoid)
+                self.assertSameValue(value, expected[0] if expected else 0.0, (seed, start, goal, quantity))
+                hops = [sym for sym, qty in route]
+                self.assertFalse(set(zip(hops[:-1], hops[1:])) & avoid)
+
+@unittest.skipIf(np is None, 'needs NumPy')
+class RateMatrixTest(unittest.TestCase):
+    def test_routes_are_loop_free(self):
+        left = 0
+        for seed in range(6):
+            coins = hubNetwork(seed)
+            matrix = RateMatrix(coins)
+            rng = random.Random(seed)
+            for maxdepth in (4, 5, 6):
+                goal = rng.choice(sorted(coins))
+                amounts = dict((sym, 10 ** rng.uniform(-1, 2)) for sym in sorted(coins))
+                found = matrix.bestRoutes(amounts, goal, maxdepth, 0.01, 20)
+                for sym, (value, route) in found.items():
+                    self.assertEqual(len(set(c for c, qty in route)), len(route), (seed, maxdepth, sym))
+                left += len(amounts) - len(found)
+        self.assertGreater(left, 0)
+
+class CycleTest(unittest.TestCase):
+    def test_cycles_match_enumeration(self):
+        total = 0
+        for seed in range(6):
+            coins = hubNetwork(seed, nalt=30)
+            graph = RouteGraph(coins, overshoot=0.01, vol_threshold=20)
+            rng = random.Random(seed)
+            for coin in rng.sample(sorted(coins), 10):
+                for quantity in (None, 0.1, 1.0, 10.0):
+                    expected = allCycles(coins, coin, quantity, 4, 0.01, 20)
+                    found = findCycles(graph, coin, maxlen=4, quantity=quantity)
+                    self.assertEqual(set(tuple(sym for sym, qty in route) for profit, route in found),
+                                     set(expected), (seed, coin, quantity))
+                    for profit, route in found:
+                        path = tuple(sym for sym, qty in route)
+                        self.assertAlmostEqual(profit, expected[path], delta=1e-9 * max(1.0, profit))
+                    total += len(found)
+        self.assertGreater(total, 0)
+
+if __name__ == '__main__':
+    unittest.main()